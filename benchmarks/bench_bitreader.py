@@ -0,0 +1,81 @@
+"""Microbenchmark of BitReader, reporting symbols decoded per second
+
+Run from the repository root: python benchmarks/bench_bitreader.py
+Random data is read as fixed width values with read and read_run, and as a 4 symbol prefix code with read_vlc. bitstring is timed for comparison when it is installed.
+"""
+
+from pathlib import Path
+import random
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from purejxr._iotools import BitReader, build_vlc_table
+
+SYMBOL_COUNT = 200000
+BIT_COUNT = 5
+RUN_SIZE = 16
+VLC_CODES = {"0": 0, "10": 1, "110": 2, "111": 3}
+REPEAT = 5
+
+
+def make_data() -> bytes:
+    # Prefix codes are at most 3 bits, fixed width values BIT_COUNT, leave a spare byte at the end
+    return random.Random(0).randbytes(SYMBOL_COUNT * max(BIT_COUNT, 3) // 8 + 1)
+
+
+def bench_read(data: bytes):
+    reader = BitReader(data)
+    read = reader.read
+    for _ in range(SYMBOL_COUNT):
+        read(BIT_COUNT)
+
+
+def bench_read_run(data: bytes):
+    reader = BitReader(data)
+    read_run = reader.read_run
+    for _ in range(SYMBOL_COUNT // RUN_SIZE):
+        read_run(RUN_SIZE, BIT_COUNT)
+
+
+def bench_read_vlc(data: bytes):
+    table, max_length = build_vlc_table(VLC_CODES)
+    reader = BitReader(data)
+    read_vlc = reader.read_vlc
+    for _ in range(SYMBOL_COUNT):
+        read_vlc(table, max_length)
+
+
+def bench_bitstring(data: bytes):
+    from bitstring import ConstBitStream
+    stream = ConstBitStream(data)
+    read = stream.read
+    for _ in range(SYMBOL_COUNT):
+        read(f"uint:{BIT_COUNT}")
+
+
+def report(name: str, bench, data: bytes):
+    seconds = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        bench(data)
+        seconds = min(seconds, time.perf_counter() - start)
+    print(f"{name}: {SYMBOL_COUNT / seconds / 1e6:.2f}M symbols/s")
+
+
+def main():
+    data = make_data()
+    report(f"read({BIT_COUNT})", bench_read, data)
+    report(f"read_run({RUN_SIZE}, {BIT_COUNT})", bench_read_run, data)
+    report(f"read_vlc, {len(VLC_CODES)} symbol prefix code", bench_read_vlc, data)
+    try:
+        import bitstring
+    except ImportError:
+        print("bitstring isn't installed, skipping the comparison")
+    else:
+        report(f"bitstring ConstBitStream.read('uint:{BIT_COUNT}')", bench_bitstring, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark codestream image header parsing and the import time of purejxr.codestream
+
+Run from the repository root: python benchmarks/bench_image_header.py [file.jxr]
+Without a file a tiled, windowed long header codestream is built so every branch of the header parser is taken.
+"""
+
+from pathlib import Path
+from struct import pack
+import subprocess
+import timeit
+import sys
+import os
+
+SRC_PATH = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_PATH))
+
+from purejxr import codestream, jxrfile
+
+ITERATIONS = 20000
+IMPORT_RUNS = 5
+
+
+def make_image_header() -> bytes:
+    """Build a 4096x2048 RGB 8 bit codestream header with 4x2 tiles and margins on every side"""
+    flags = 1 << 23 | 1 << 22 | 1 << 18 | 1 << 16 | 1 << 13 | 7 << 4 # tiling, frequency mode, index table, overlap, windowing, RGB
+    tile_counts = (4 - 1) << 12 | (2 - 1)
+    margins = 1 << 18 | 2 << 12 | 3 << 6 | 4
+    return (
+        codestream.CODESTREAM_IMAGE_HEADER_SIGNATURE
+        + pack(">III", flags, 4096 - 1, 2048 - 1)
+        + tile_counts.to_bytes(3, "big")
+        + pack(">4H", 64, 64, 64, 64) # the 3 stored tile widths then the 1 stored tile height, in macroblocks
+        + margins.to_bytes(3, "big")
+    )
+
+
+def load_image_header(path: str) -> bytes:
+    """Return the head of the image codestream of a .jxr file"""
+    with open(path, "rb") as file:
+        ifd = jxrfile.read(file).image_file_directories[0]
+        offset = jxrfile.decode_uint_entry(ifd.entries[jxrfile.JXRFieldTag.IMAGE_OFFSET])
+        file.seek(offset)
+        return file.read(256)
+
+
+def get_import_time(module: str) -> float:
+    """Return the cumulative import time of a module in microseconds, the best of IMPORT_RUNS fresh interpreters"""
+    env = dict(os.environ, PYTHONPATH=str(SRC_PATH))
+    times = []
+    for _ in range(IMPORT_RUNS):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = [field.strip() for field in line.removeprefix("import time:").split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                times.append(int(fields[1]))
+    return min(times)
+
+
+def main():
+    data = load_image_header(sys.argv[1]) if len(sys.argv) > 1 else make_image_header()
+    image_header = codestream.read_image_header(data)
+    print(f"image header: {image_header.width}x{image_header.height}, {image_header.vertical_tile_count}x{image_header.horizontal_tile_count} tiles")
+
+    seconds = min(timeit.repeat(lambda: codestream.read_image_header(data), number=ITERATIONS, repeat=5))
+    print(f"read_image_header: {seconds / ITERATIONS * 1e6:.2f} us per header")
+    print(f"import purejxr.codestream: {get_import_time('purejxr.codestream') / 1000:.1f} ms cumulative")
+
+
+if __name__ == "__main__":
+    main()
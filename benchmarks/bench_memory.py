@@ -0,0 +1,96 @@
+"""Benchmark of the memory retained per parsed .jxr file, measured with tracemalloc
+
+Run from the repository root: python benchmarks/bench_memory.py [file or directory ...]
+Directories are searched for .jxr files recursively. Without arguments a corpus of CORPUS_SIZE small files, 8 entries per ifd, is built with jxrfile.write.
+"""
+
+from pathlib import Path
+from struct import pack
+import tracemalloc
+import io
+import gc
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from purejxr import codestream, jxrfile
+from purejxr.jxrfile import JXRFieldTag, JXRElementType, JXRImageFileDirectoryEntry
+
+CORPUS_SIZE = 300
+REPEAT = 20 # Each file is parsed this many times, so the figures are averaged over many copies
+
+
+def make_file(index: int) -> bytes:
+    """Build a .jxr file whose image payload is just a codestream image header"""
+    width, height = 256 + index, 128 + index
+    image_header = codestream.CODESTREAM_IMAGE_HEADER_SIGNATURE + pack(">IHH", 1 << 15 | 7 << 4, width - 1, height - 1) # short header, RGB 8 bit
+    entries = [
+        JXRImageFileDirectoryEntry(JXRFieldTag.PIXEL_FORMAT, JXRElementType.BYTE, 16, bytes(range(16))),
+        JXRImageFileDirectoryEntry(JXRFieldTag.IMAGE_TYPE, JXRElementType.ULONG, 1, pack("<I", 0)),
+        JXRImageFileDirectoryEntry(JXRFieldTag.IMAGE_WIDTH, JXRElementType.ULONG, 1, pack("<I", width)),
+        JXRImageFileDirectoryEntry(JXRFieldTag.IMAGE_HEIGHT, JXRElementType.ULONG, 1, pack("<I", height)),
+        JXRImageFileDirectoryEntry(JXRFieldTag.WIDTH_RESOLUTION, JXRElementType.FLOAT, 1, pack("<f", 96.0)),
+        JXRImageFileDirectoryEntry(JXRFieldTag.HEIGHT_RESOLUTION, JXRElementType.FLOAT, 1, pack("<f", 96.0))
+    ]
+    jxr_file = jxrfile.JXRFile(jxrfile.JXRHeader(1, 8), [jxrfile.JXRImageFileDirectory(len(entries), {entry.tag: entry for entry in entries}, 0)])
+    stream = io.BytesIO()
+    jxrfile.write(stream, jxr_file, image_header)
+    return stream.getvalue()
+
+
+def load_corpus(paths: list[str]) -> list[bytes]:
+    files = []
+    for path in map(Path, paths):
+        for file_path in sorted(path.rglob("*.jxr")) if path.is_dir() else [path]:
+            data = file_path.read_bytes()
+            try:
+                jxrfile.read(data)
+            except Exception as error:
+                print(f"skipping {file_path}: {error}")
+                continue
+            files.append(data)
+    return files
+
+
+def measure(build, corpus: list[bytes]) -> float:
+    """Return the bytes still allocated per file after build has parsed every file REPEAT times, build returns whatever it keeps"""
+    gc.collect()
+    tracemalloc.start()
+    results = build(corpus)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return retained / (REPEAT * len(corpus))
+
+
+def read_with_image_headers(corpus: list[bytes]) -> list:
+    results = []
+    for _ in range(REPEAT):
+        for data in corpus:
+            jxr_file = jxrfile.read(data)
+            results.append((jxr_file, codestream.read_image_header(jxr_file.image_file_directories[0].image_bitstream())))
+    return results
+
+
+def read_files(corpus: list[bytes]) -> list:
+    return [jxrfile.read(data) for _ in range(REPEAT) for data in corpus]
+
+
+def read_columnar(corpus: list[bytes]) -> jxrfile.JXRColumnarEntries:
+    columnar_entries = jxrfile.JXRColumnarEntries()
+    for _ in range(REPEAT):
+        for data in corpus:
+            for ifd in jxrfile.iter_image_file_directories(data, lazy=True):
+                columnar_entries.append_image_file_directory(ifd)
+    return columnar_entries
+
+
+def main():
+    corpus = load_corpus(sys.argv[1:]) if len(sys.argv) > 1 else [make_file(index) for index in range(CORPUS_SIZE)]
+    print(f"{len(corpus)} files x {REPEAT}")
+    print(f"read() + codestream header: {measure(read_with_image_headers, corpus):.0f} bytes per file")
+    print(f"read(): {measure(read_files, corpus):.0f} bytes per file")
+    print(f"columnar entries: {measure(read_columnar, corpus):.0f} bytes per file (out of line data not included)")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 from sys import argv
 from .jxrfile import read, read_header
 
-with open(argv[1], "rb") as stream:
-    jxr_file = read(stream)
-    print(jxr_file)
+if __name__ == "__main__":
+    if len(argv) > 1 and argv[1] == "scan":
+        from .scanner import main
+        main(argv[2:])
+    else:
+        with open(argv[1], "rb") as stream:
+            jxr_file = read(stream)
+            print(jxr_file)
@@ -0,0 +1,22 @@
+from dataclasses import fields
+
+"""
+Dataclass tools
+"""
+def slotted(cls: type) -> type:
+    """Recreate a dataclass with __slots__ holding its' fields, dropping the per instance __dict__
+
+    This mirrors dataclass(slots=True), which is only available from python 3.10. It must be applied above the dataclass decorator.
+    """
+    field_names = tuple(field.name for field in fields(cls))
+    cls_dict = dict(cls.__dict__)
+    cls_dict["__slots__"] = field_names
+    for field_name in field_names:
+        # Field defaults are class attributes, which would conflict with the slots, dataclass has already captured them in __init__
+        cls_dict.pop(field_name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
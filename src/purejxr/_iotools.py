@@ -1,45 +1,723 @@
-from typing import BinaryIO
+from typing import BinaryIO, Union, Generator, Any, Optional
+from struct import Struct
+from bisect import bisect_right
+from io import FileIO, BufferedReader, BufferedRandom, UnsupportedOperation, SEEK_SET, SEEK_END
+from mmap import mmap, ACCESS_READ
+from threading import Lock
+from tempfile import SpooledTemporaryFile
+import sys
+import os
+
+
+"""
+Exceptions
+"""
+class ReleasedRangeError(Exception): """Exception caused when reading bytes a StreamingReader has already consumed and not retained."""
+
+
+"""
+Record IO
+"""
+def read_exact(stream: BinaryIO, size: int) -> bytes:
+    """Read exactly size bytes from the stream, raising EOFError on a short read"""
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError(f"Unexpected end of stream: expected {size} bytes, got {len(data)}")
+    return data
+
+
+def read_record(stream: BinaryIO, layout: Struct) -> tuple:
+    """Read a whole fixed size record with a single read and unpack it using a precompiled layout"""
+    return layout.unpack(read_exact(stream, layout.size))
+
+
+def unpack_record(buffer, offset: int, layout: Struct) -> tuple:
+    """Unpack a fixed size record from a buffer at the given offset using a precompiled layout"""
+    if offset + layout.size > len(buffer):
+        raise EOFError(f"Unexpected end of buffer: expected {layout.size} bytes at offset {offset}, buffer is {len(buffer)} bytes")
+    return layout.unpack_from(buffer, offset)
 
 
 """
 Integer IO
 """
+_ENDIAN_PREFIXES = {"little": "<", "big": ">"}
+INT32 = {endian: Struct(prefix + "i") for endian, prefix in _ENDIAN_PREFIXES.items()}
+UINT32 = {endian: Struct(prefix + "I") for endian, prefix in _ENDIAN_PREFIXES.items()}
+INT16 = {endian: Struct(prefix + "h") for endian, prefix in _ENDIAN_PREFIXES.items()}
+UINT16 = {endian: Struct(prefix + "H") for endian, prefix in _ENDIAN_PREFIXES.items()}
+INT8 = Struct("b")
+UINT8 = Struct("B")
+
+
 def read_int32(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(4)
-    return int.from_bytes(data, endian, signed=True)
+    return read_record(stream, INT32[endian])[0]
 
 
 def read_uint32(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(4)
-    return int.from_bytes(data, endian, signed=False)
+    return read_record(stream, UINT32[endian])[0]
 
 
 def read_int16(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(2)
-    return int.from_bytes(data, endian, signed=True)
+    return read_record(stream, INT16[endian])[0]
 
 
 def read_uint16(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(2)
-    return int.from_bytes(data, endian, signed=False)
+    return read_record(stream, UINT16[endian])[0]
 
 
 def read_int12(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(3)
+    data = read_exact(stream, 3)
     return int.from_bytes(data, endian, signed=True)
 
 
 def read_uint12(stream: BinaryIO, endian: str = "little") -> int:
-    data = stream.read(3)
+    data = read_exact(stream, 3)
     return int.from_bytes(data, endian, signed=False)
 
 
 def read_int8(stream: BinaryIO) -> int:
-    data = stream.read(1)
-    return int.from_bytes(data, signed=True)
+    return read_record(stream, INT8)[0]
 
 
 def read_uint8(stream: BinaryIO) -> int:
-    data = stream.read(1)
-    return int.from_bytes(data, signed=False)
+    return read_record(stream, UINT8)[0]
+
+
+"""
+Positional IO
+"""
+class PositionalReader:
+    """Base of the sources which are read at explicit offsets
+    
+    Reads never depend on or modify a shared stream position, so one reader can be used by many threads at once.
+    """
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read up to size bytes starting at offset, fewer bytes are returned at the end of the source"""
+        raise NotImplementedError
+
+    def get_size(self) -> Optional[int]:
+        """Return the size of the source in bytes, or None when it isn't known up front"""
+        return None
+
+
+class FileReader(PositionalReader):
+    """Positional reader over an OS file descriptor, using os.pread"""
+
+    def __init__(self, file: Union[int, BinaryIO]):
+        self.file = file # Keep a reference so the file isn't closed while we read it
+        self.fd = file if isinstance(file, int) else file.fileno()
+
+    def check_open(self):
+        """Raise ValueError if the wrapped file object has been closed, its' descriptor may since have been reused by another file"""
+        if getattr(self.file, "closed", False):
+            raise ValueError("I/O operation on closed file")
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        self.check_open()
+        data = os.pread(self.fd, size, offset)
+        # pread is allowed to return less than requested before the end of the file
+        while len(data) < size:
+            chunk = os.pread(self.fd, size - len(data), offset + len(data))
+            if not chunk:
+                break
+            data += chunk
+
+        return data
+
+    def get_size(self) -> int:
+        self.check_open()
+        return os.fstat(self.fd).st_size
+
+
+class StreamReader(PositionalReader):
+    """Positional reader over a seekable stream, a lock serialises each seek and read pair so the stream can be shared between threads"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.lock = Lock()
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        with self.lock:
+            self.stream.seek(offset)
+            return self.stream.read(size)
+
+    def get_size(self) -> int:
+        with self.lock:
+            return self.stream.seek(0, SEEK_END)
+
+
+class BufferReader(PositionalReader):
+    """Positional reader over a buffer, reads return memoryview slices of the buffer instead of copies"""
+
+    def __init__(self, buffer: Union[mmap, bytes, bytearray, memoryview]):
+        self.buffer = memoryview(buffer).cast("B")
+
+    def read_at(self, offset: int, size: int) -> memoryview:
+        return self.buffer[offset:offset + size]
+
+    def get_size(self) -> int:
+        return len(self.buffer)
+
+
+STREAM_MEMORY_LIMIT = 16 * 1024 * 1024 # Retained bytes beyond this are spilled to a temporary file
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingReader(PositionalReader):
+    """Positional reader over a forward only stream, such as a pipe, socket or HTTP response body
+    
+    The stream is only consumed as far as the furthest read. Consumed bytes are retained so that earlier offsets can still be read, in memory up to memory_limit bytes and in a temporary file beyond that. Once the ranges still needed are known, retain drops everything else.
+    """
+
+    def __init__(self, stream: BinaryIO, memory_limit: int = STREAM_MEMORY_LIMIT):
+        self.stream = stream
+        self.memory_limit = memory_limit
+        self.position = 0 # Number of bytes consumed from the stream
+        self.retained_ranges = None # (offset, size) ranges kept as the stream is consumed, None keeps everything
+        self.segments = [] # [offset, size, spool position] of each retained run of bytes, in stream order
+        self.spool = SpooledTemporaryFile(max_size=memory_limit)
+        self.lock = Lock()
+
+    def _append(self, offset: int, data: bytes):
+        """Retain data consumed at offset"""
+        self.spool.seek(0, SEEK_END)
+        if self.segments and self.segments[-1][0] + self.segments[-1][1] == offset:
+            self.segments[-1][1] += len(data)
+        else:
+            self.segments.append([offset, len(data), self.spool.tell()])
+        self.spool.write(data)
+
+    def _consume(self, end: int):
+        """Consume the stream up to end, or the end of the stream, retaining the bytes still needed"""
+        while self.position < end:
+            chunk = self.stream.read(min(end - self.position, STREAM_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            if self.retained_ranges is None:
+                self._append(self.position, chunk)
+            else:
+                chunk_end = self.position + len(chunk)
+                for start, size in self.retained_ranges:
+                    overlap_start = max(start, self.position)
+                    overlap_end = min(start + size, chunk_end)
+                    if overlap_start < overlap_end:
+                        self._append(overlap_start, chunk[overlap_start - self.position:overlap_end - self.position])
+            self.position += len(chunk)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        with self.lock:
+            self._consume(offset + size)
+            if offset >= self.position:
+                return b""
+
+            # Find the retained run holding offset, reads may not continue past its end unless the stream ends there
+            for segment_offset, segment_size, spool_position in self.segments:
+                segment_end = segment_offset + segment_size
+                if segment_offset <= offset < segment_end and (offset + size <= segment_end or segment_end == self.position):
+                    self.spool.seek(spool_position + offset - segment_offset)
+                    return self.spool.read(min(size, segment_end - offset))
+
+            raise ReleasedRangeError(f"Bytes {offset} to {offset + size} have already been consumed and released")
+
+    def retain(self, ranges: list[tuple[int, int]]):
+        """Keep only the given (offset, size) ranges from now on, every other retained byte is dropped and the rest of the stream is skipped as it is consumed"""
+        with self.lock:
+            old_spool, old_segments = self.spool, self.segments
+            self.retained_ranges = coalesce_ranges(ranges, 0)
+            self.segments = []
+            self.spool = SpooledTemporaryFile(max_size=self.memory_limit)
+
+            # Carry over the parts of the retained ranges which have already been consumed
+            for start, size in self.retained_ranges:
+                for segment_offset, segment_size, spool_position in old_segments:
+                    overlap_start = max(start, segment_offset)
+                    overlap_end = min(start + size, segment_offset + segment_size)
+                    if overlap_start < overlap_end:
+                        old_spool.seek(spool_position + overlap_start - segment_offset)
+                        self._append(overlap_start, old_spool.read(overlap_end - overlap_start))
+            old_spool.close()
+
+
+class SpeculativeReader(PositionalReader):
+    """Positional reader which fetches whole windows of at least window_size bytes and serves later reads falling inside them from memory
+    
+    Counts the reads issued to, and bytes returned by, the underlying reader so callers can tune window_size.
+    """
+
+    def __init__(self, reader: PositionalReader, window_size: int):
+        self.reader = reader
+        self.window_size = window_size
+        self.windows = [] # (offset, data, ends at the end of the source) of each fetched window
+        self.read_count = 0
+        self.bytes_read = 0
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        for window_offset, window_data, window_at_end in self.windows:
+            window_end = window_offset + len(window_data)
+            if window_offset <= offset <= window_end and (offset + size <= window_end or window_at_end):
+                return window_data[offset - window_offset:offset - window_offset + size]
+
+        window_size = max(size, self.window_size)
+        window_data = self.reader.read_at(offset, window_size)
+        self.read_count += 1
+        self.bytes_read += len(window_data)
+        self.windows.append((offset, window_data, len(window_data) < window_size))
+        return window_data[:size]
+
+    def get_size(self) -> Optional[int]:
+        return self.reader.get_size()
+
+
+class RangeReader(PositionalReader):
+    """Positional reader over the size bytes at offset of another reader, offsets are relative to the start of the range and reads stop at its' end"""
+
+    def __init__(self, reader: PositionalReader, offset: int, size: int):
+        self.reader = reader
+        self.offset = offset
+        self.size = size
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        if offset >= self.size:
+            return b""
+        return self.reader.read_at(self.offset + offset, min(size, self.size - offset))
+
+    def get_size(self) -> int:
+        return self.size
+
+
+def view_range(reader: PositionalReader, offset: int, size: int) -> Union[memoryview, RangeReader]:
+    """Return a zero copy view of the size bytes at offset of a reader, a memoryview slice for buffers and a RangeReader otherwise"""
+    while isinstance(reader, RangeReader) and offset + size <= reader.size:
+        reader, offset = reader.reader, reader.offset + offset
+    if isinstance(reader, BufferReader):
+        return reader.read_at(offset, size)
+    return RangeReader(reader, offset, size)
+
+
+def open_buffer(source: Union[str, os.PathLike, mmap, bytes, bytearray, memoryview]) -> memoryview:
+    """Return a flat byte memoryview over the source, paths are memory mapped read only rather than read into memory"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            source = mmap(file.fileno(), 0, access=ACCESS_READ)
+    
+    return memoryview(source).cast("B")
+
+
+def as_reader(source: Union[PositionalReader, BinaryIO, int, mmap, bytes, bytearray, memoryview]) -> PositionalReader:
+    """Return the positional reader suited to a source, positional readers are returned as is
+    
+    Buffers are sliced directly, real files (and file descriptors) use os.pread where available, any other seekable stream falls back to locked seek and read pairs and forward only streams are read with a StreamingReader.
+    """
+    if isinstance(source, PositionalReader):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview, mmap)):
+        return BufferReader(source)
+    if not isinstance(source, int) and not source.seekable():
+        return StreamingReader(source)
+    if hasattr(os, "pread") and isinstance(source, (int, FileIO, BufferedReader, BufferedRandom)):
+        return FileReader(source)
+
+    return StreamReader(source)
+
+
+def get_source_offset(source: Union[PositionalReader, BinaryIO, int, mmap, bytes, bytearray, memoryview], offset: Optional[int]) -> int:
+    """Return offset, or when it isn't given the current position of a seekable stream source, so data can still be read from wherever the caller seeked to"""
+    if offset is not None:
+        return offset
+    if isinstance(source, (PositionalReader, int, bytes, bytearray, memoryview, mmap)) or not source.seekable():
+        # Forward only streams are read from their current position as offset 0
+        return 0
+    return source.tell()
+
+
+def read_exact_at(reader: PositionalReader, offset: int, size: int) -> bytes:
+    """Read exactly size bytes at offset, raising EOFError on a short read"""
+    data = reader.read_at(offset, size)
+    if len(data) != size:
+        raise EOFError(f"Unexpected end of stream: expected {size} bytes at offset {offset}, got {len(data)}")
+    return data
+
+
+def read_record_at(reader: PositionalReader, offset: int, layout: Struct) -> tuple:
+    """Read a whole fixed size record at offset with a single read and unpack it using a precompiled layout"""
+    return layout.unpack(read_exact_at(reader, offset, layout.size))
+
+
+"""
+Parsers
+
+Parsers are generators which yield (offset, size) read requests, are sent back exactly size bytes for each and return their result. This keeps parsing independent of how bytes are read, the same parser runs over a PositionalReader with run_parser or over an AsyncPositionalReader with run_parser_async.
+"""
+Parser = Generator[tuple[int, int], bytes, Any]
+
+
+def run_parser(reader: PositionalReader, parser: Parser) -> Any:
+    """Run a parser to completion, serving each of its' read requests from a reader"""
+    data = None
+    while True:
+        try:
+            offset, size = parser.send(data)
+        except StopIteration as stop:
+            return stop.value
+        data = read_exact_at(reader, offset, size)
+
+
+"""
+Range IO
+"""
+COALESCE_MAX_GAP = 4096 # Ranges closer together than this are served by the same read
+
+
+def coalesce_ranges(ranges: list[tuple[int, int]], max_gap: int = COALESCE_MAX_GAP) -> list[tuple[int, int]]:
+    """Merge (offset, size) ranges which overlap or lie within max_gap bytes of each other into as few (offset, size) spans as possible"""
+    spans = []
+    for offset, size in sorted(ranges):
+        end = offset + size
+        if spans and offset - spans[-1][1] <= max_gap:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([offset, end])
+
+    return [(start, end - start) for start, end in spans]
+
+
+def parse_ranges(ranges: list[tuple[int, int]], max_gap: int = COALESCE_MAX_GAP) -> Parser:
+    """Parser for (offset, size) ranges using coalesced reads, returns the data for each range in the order given and the number of reads issued"""
+    spans = coalesce_ranges(ranges, max_gap)
+    span_starts = [start for start, _ in spans]
+    span_data = []
+    for span in spans:
+        span_data.append((yield span))
+
+    # Slice each range back out of the span which contains it
+    range_data = []
+    for offset, size in ranges:
+        span_index = bisect_right(span_starts, offset) - 1
+        data = span_data[span_index]
+        relative_offset = offset - span_starts[span_index]
+        if relative_offset != 0 or size != len(data):
+            data = data[relative_offset:relative_offset + size]
+        range_data.append(data)
+
+    return range_data, len(spans)
+
+
+def read_ranges(reader: PositionalReader, ranges: list[tuple[int, int]], max_gap: int = COALESCE_MAX_GAP) -> tuple[list[bytes], int]:
+    """Read (offset, size) ranges using coalesced reads, returns the data for each range in the order given and the number of reads issued"""
+    return run_parser(reader, parse_ranges(ranges, max_gap))
+
+
+"""
+Output IO
+
+Payloads are copied to the output without being buffered whole, buffers are written directly and file ranges are copied by the kernel where the platform allows it.
+"""
+COPY_CHUNK_SIZE = 1024 * 1024 # Size of each read when a payload has to be copied through python
+
+Payload = Union[bytes, bytearray, memoryview, mmap, PositionalReader]
+
+
+def get_payload_size(payload: Payload) -> int:
+    """Return the size, in bytes, of a payload"""
+    if isinstance(payload, PositionalReader):
+        size = payload.get_size()
+        if size is None:
+            raise ValueError(f"Payload of unknown size: {payload!r}")
+        return size
+
+    return memoryview(payload).nbytes
+
+
+def copy_file_range_fd(in_fd: int, in_offset: int, out_fd: int, out_offset: Optional[int], size: int) -> int:
+    """Copy up to size bytes between file descriptors inside the kernel, returns the number of bytes copied which is 0 where the platform or file systems don't support it
+
+    An out_offset of None writes at the output's current position without seeking it, for outputs such as pipes and sockets which can't seek.
+    """
+    copied = 0
+    if hasattr(os, "copy_file_range") and out_offset is not None:
+        try:
+            while copied < size:
+                count = os.copy_file_range(in_fd, out_fd, size - copied, in_offset + copied, out_offset + copied)
+                if count == 0:
+                    break
+                copied += count
+            return copied
+        except OSError:
+            # Older kernels refuse copies across file systems, fall through to sendfile
+            pass
+
+    # sendfile needs the input to be a regular file, and isn't available for every output on other platforms
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            if out_offset is not None:
+                os.lseek(out_fd, out_offset + copied, SEEK_SET)
+            while copied < size:
+                count = os.sendfile(out_fd, in_fd, in_offset + copied, size - copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            pass
+
+    return copied
+
+
+def write_payload(stream: BinaryIO, payload: Payload) -> int:
+    """Write a payload to stream at its' current position, returns the number of bytes written
+    
+    Ranges of real files written to real files are copied by the kernel (copy_file_range or sendfile), other readers are copied in COPY_CHUNK_SIZE reads.
+    """
+    if not isinstance(payload, PositionalReader):
+        return stream.write(memoryview(payload).cast("B"))
+
+    size = get_payload_size(payload)
+    reader, offset = payload, 0
+    while isinstance(reader, RangeReader):
+        reader, offset = reader.reader, offset + reader.offset
+    if isinstance(reader, BufferReader):
+        return stream.write(reader.read_at(offset, size))
+
+    written = 0
+    if isinstance(reader, FileReader):
+        reader.check_open()
+        try:
+            out_fd = stream.fileno()
+        except (AttributeError, OSError, UnsupportedOperation):
+            out_fd = None
+        if out_fd is not None:
+            stream.flush()
+            if stream.seekable():
+                position = stream.tell()
+                written = copy_file_range_fd(reader.fd, offset, out_fd, position, size)
+                stream.seek(position + written)
+            else:
+                # Pipes and sockets are written at their current position, in one forward pass
+                written = copy_file_range_fd(reader.fd, offset, out_fd, None, size)
+
+    while written < size:
+        chunk = read_exact_at(reader, offset + written, min(size - written, COPY_CHUNK_SIZE))
+        stream.write(chunk)
+        written += len(chunk)
+
+    return written
+
+
+"""
+Async IO
+
+asyncio and inspect are imported where they are used, they would otherwise dominate the import time of the package for blocking users.
+"""
+class AsyncPositionalReader:
+    """Base of the async sources which are read at explicit offsets, any object with an awaitable read_at(offset, size) method can be used in its' place"""
+
+    async def read_at(self, offset: int, size: int) -> bytes:
+        """Read up to size bytes starting at offset, fewer bytes are returned at the end of the source"""
+        raise NotImplementedError
+
+
+class AsyncFileReader(AsyncPositionalReader):
+    """Async positional reader over a file object with awaitable seek and read methods, such as those opened with aiofiles"""
+
+    def __init__(self, file: Any):
+        self.file = file
+        import asyncio
+        self.lock = asyncio.Lock()
+
+    async def read_at(self, offset: int, size: int) -> bytes:
+        async with self.lock:
+            await self.file.seek(offset)
+            return await self.file.read(size)
+
+
+class AsyncBufferReader(AsyncPositionalReader):
+    """Async positional reader over a buffer, reads complete immediately and return memoryview slices of the buffer"""
+
+    def __init__(self, buffer: Union[mmap, bytes, bytearray, memoryview]):
+        self.reader = BufferReader(buffer)
+
+    async def read_at(self, offset: int, size: int) -> memoryview:
+        return self.reader.read_at(offset, size)
+
+
+class ExecutorAsyncReader(AsyncPositionalReader):
+    """Async positional reader which runs the reads of a blocking PositionalReader in an executor, the event loop's default thread pool unless one is given"""
+
+    def __init__(self, reader: PositionalReader, executor: Any = None):
+        self.reader = reader
+        self.executor = executor
+
+    async def read_at(self, offset: int, size: int) -> bytes:
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.reader.read_at, offset, size)
+
+
+def as_async_reader(source: Any) -> AsyncPositionalReader:
+    """Return the async positional reader suited to a source
+    
+    Objects with an awaitable read_at are returned as is, async file objects are wrapped with AsyncFileReader, buffers with AsyncBufferReader and any other source has its' blocking reads run in the default executor.
+    """
+    from inspect import iscoroutinefunction
+    if iscoroutinefunction(getattr(source, "read_at", None)):
+        return source
+    if iscoroutinefunction(getattr(source, "read", None)):
+        return AsyncFileReader(source)
+    if isinstance(source, (bytes, bytearray, memoryview, mmap)):
+        return AsyncBufferReader(source)
+
+    return ExecutorAsyncReader(as_reader(source))
+
+
+async def read_exact_at_async(reader: AsyncPositionalReader, offset: int, size: int) -> bytes:
+    """Read exactly size bytes at offset, raising EOFError on a short read"""
+    data = await reader.read_at(offset, size)
+    if len(data) != size:
+        raise EOFError(f"Unexpected end of stream: expected {size} bytes at offset {offset}, got {len(data)}")
+    return data
+
+
+async def run_parser_async(reader: AsyncPositionalReader, parser: Parser) -> Any:
+    """Run a parser to completion, awaiting each of its' read requests from an async reader"""
+    data = None
+    while True:
+        try:
+            offset, size = parser.send(data)
+        except StopIteration as stop:
+            return stop.value
+        data = await read_exact_at_async(reader, offset, size)
+
+
+"""
+Bit IO
+"""
+BIT_READER_MAX_PEEK = 57 # A refill always leaves at least this many bits in the accumulator, unless the buffer runs out
+
+
+class BitReader:
+    """Most significant bit first reader over a buffer, for entropy coded data
+    
+    Bits are loaded a whole number of bytes at a time into an accumulator holding at most 64 bits, so most reads are a shift and a mask on an int. Peeking past the end of the buffer yields zero bits, reading past it raises EOFError.
+    """
+    __slots__ = ("buffer", "byte_position", "accumulator", "bit_count")
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview], bit_offset: int = 0):
+        self.buffer = memoryview(buffer).cast("B")
+        self.byte_position = bit_offset >> 3
+        self.accumulator = 0
+        self.bit_count = 0 # Valid bits in the accumulator, the low bit_count bits
+        if bit_offset & 7:
+            self.skip(bit_offset & 7)
+
+    def refill(self):
+        """Top up the accumulator with as many whole bytes as fit in 64 bits"""
+        byte_count = (64 - self.bit_count) >> 3
+        chunk = self.buffer[self.byte_position:self.byte_position + byte_count]
+        self.accumulator = (self.accumulator << (len(chunk) << 3)) | int.from_bytes(chunk, "big")
+        self.bit_count += len(chunk) << 3
+        self.byte_position += len(chunk)
+
+    def peek(self, bit_count: int) -> int:
+        """Return the next bit_count bits (at most BIT_READER_MAX_PEEK) without consuming them"""
+        if self.bit_count < bit_count:
+            self.refill()
+            if self.bit_count < bit_count:
+                return (self.accumulator << (bit_count - self.bit_count)) & ((1 << bit_count) - 1)
+        return (self.accumulator >> (self.bit_count - bit_count)) & ((1 << bit_count) - 1)
+
+    def skip(self, bit_count: int):
+        """Consume the next bit_count bits"""
+        while bit_count > self.bit_count:
+            bit_count -= self.bit_count
+            self.accumulator = 0
+            self.bit_count = 0
+            if bit_count >= 64:
+                skipped_bytes = min(bit_count >> 3, len(self.buffer) - self.byte_position)
+                self.byte_position += skipped_bytes
+                bit_count -= skipped_bytes << 3
+            self.refill()
+            if self.bit_count == 0 and bit_count:
+                raise EOFError(f"Unexpected end of bitstream: {bit_count} bits past the end of the buffer")
+        self.bit_count -= bit_count
+        self.accumulator &= (1 << self.bit_count) - 1
+
+    def read(self, bit_count: int) -> int:
+        """Read an unsigned bit_count bit integer"""
+        if bit_count > BIT_READER_MAX_PEEK:
+            high = self.read(bit_count - 32)
+            return (high << 32) | self.read(32)
+        if self.bit_count < bit_count:
+            self.refill()
+            if self.bit_count < bit_count:
+                raise EOFError(f"Unexpected end of bitstream: expected {bit_count} bits, got {self.bit_count}")
+        self.bit_count -= bit_count
+        value = self.accumulator >> self.bit_count
+        self.accumulator &= (1 << self.bit_count) - 1
+        return value
+
+    def read_bool(self) -> bool:
+        return self.read(1) == 1
+
+    def read_run(self, count: int, bit_count: int) -> list[int]:
+        """Read a run of count unsigned bit_count bit integers"""
+        if bit_count == 0:
+            return [0] * count
+        if bit_count > BIT_READER_MAX_PEEK:
+            return [self.read(bit_count) for _ in range(count)]
+
+        # Keep the accumulator in locals for the length of the run
+        values = []
+        append = values.append
+        accumulator = self.accumulator
+        available = self.bit_count
+        buffer = self.buffer
+        position = self.byte_position
+        for _ in range(count):
+            if available < bit_count:
+                byte_count = (64 - available) >> 3
+                chunk = buffer[position:position + byte_count]
+                accumulator = (accumulator << (len(chunk) << 3)) | int.from_bytes(chunk, "big")
+                available += len(chunk) << 3
+                position += len(chunk)
+                if available < bit_count:
+                    self.accumulator, self.bit_count, self.byte_position = accumulator, available, position
+                    raise EOFError(f"Unexpected end of bitstream: expected {bit_count} bits, got {available}")
+            available -= bit_count
+            append(accumulator >> available)
+            accumulator &= (1 << available) - 1
+
+        self.accumulator, self.bit_count, self.byte_position = accumulator, available, position
+        return values
+
+    def read_vlc(self, table: list[tuple[int, int]], max_length: int) -> int:
+        """Read a variable length code using a lookup table from build_vlc_table, returns the decoded symbol"""
+        symbol, length = table[self.peek(max_length)]
+        if length == 0:
+            raise ValueError(f"Invalid variable length code: {self.peek(max_length):0{max_length}b}")
+        self.skip(length)
+        return symbol
+
+    def align(self):
+        """Skip to the next byte boundary"""
+        self.skip(self.bit_count & 7)
+
+    def tell(self) -> int:
+        """Return the position of the next bit to be read, in bits from the start of the buffer"""
+        return (self.byte_position << 3) - self.bit_count
+
+    def bits_left(self) -> int:
+        return (len(self.buffer) << 3) - self.tell()
+
+
+def build_vlc_table(codes: dict[str, int]) -> tuple[list[tuple[int, int]], int]:
+    """Build a lookup table for BitReader.read_vlc from a prefix code given as {"0101": symbol}, returns the table and the length of its' longest code"""
+    max_length = max(len(code) for code in codes)
+    table = [(0, 0)] * (1 << max_length)
+    for code, symbol in codes.items():
+        padding = max_length - len(code)
+        first = int(code, 2) << padding
+        for index in range(first, first + (1 << padding)):
+            table[index] = (symbol, len(code))
 
+    return table, max_length
@@ -0,0 +1,158 @@
+"""Module to cache parsed .jxr metadata on disk, so unchanged files don't need to be parsed again"""
+
+from typing import Union
+from dataclasses import dataclass
+from collections import OrderedDict
+from threading import Lock
+from time import time_ns
+import pickle
+import sqlite3
+import os
+
+from ._datatools import *
+from .jxrfile import JXRFile, read
+from .codestream import CodestreamImageHeader, read_image_header
+
+"""
+Constants
+"""
+CACHE_MAX_ENTRIES = 1_000_000 # Least recently used entries beyond this are evicted from the database
+CACHE_MEMORY_ENTRIES = 4096 # Most recently used entries kept unpickled in memory
+CACHE_TOUCH_FLUSH_COUNT = 1024 # Hits whose last use time is batched before being written to the database
+CACHE_EVICTION_INTERVAL = 1024 # Inserts between checks of the database entry count
+CACHE_FORMAT_VERSION = 4 # Bumped whenever the pickled metadata classes change, databases of other versions are cleared
+
+
+"""
+Data
+"""
+@slotted
+@dataclass
+class CachedMetadata:
+    """Parsed metadata of a .jxr file, the container data along with the image header of its' first codestream"""
+    jxr_file: JXRFile
+    image_header: CodestreamImageHeader
+
+
+def load_metadata(path: Union[str, os.PathLike]) -> CachedMetadata:
+    """Parse the metadata of a .jxr file"""
+    with open(path, "rb") as file:
+        jxr_file = read(file)
+        image_header = read_image_header(jxr_file.image_file_directories[0].image_bitstream())
+
+    # The file is closed once we return, cached ifds must not hold on to it whether they are served from memory or the database
+    for ifd in jxr_file.image_file_directories:
+        ifd.reader = None
+
+    return CachedMetadata(jxr_file, image_header)
+
+
+"""
+Cache
+"""
+class MetadataCache:
+    """Persistent cache of parsed .jxr metadata backed by an sqlite3 database
+    
+    Entries are keyed by path, size and modification time, so a changed file is parsed again. The most recently used entries are also kept in memory, making warm lookups cost a stat call and a dict lookup. The database holds at most max_entries entries, evicting the least recently used ones. Values are pickled, so the database must not be shared with untrusted parties.
+    """
+
+    def __init__(self, database_path: Union[str, os.PathLike], max_entries: int = CACHE_MAX_ENTRIES, memory_entries: int = CACHE_MEMORY_ENTRIES):
+        self.connection = sqlite3.connect(database_path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != CACHE_FORMAT_VERSION:
+            # Values pickled from older metadata classes can't be loaded into the current ones
+            self.connection.execute("DROP TABLE IF EXISTS metadata")
+            self.connection.execute(f"PRAGMA user_version = {CACHE_FORMAT_VERSION}")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS metadata (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, last_used INTEGER NOT NULL, value BLOB NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)")
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict() # (path, size, mtime_ns): CachedMetadata
+        self.touched = {} # path: last use time not yet written to the database
+        self.inserts_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def __enter__(self) -> "MetadataCache":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _remember(self, key: tuple[str, int, int], metadata: CachedMetadata):
+        """Keep an entry in memory, dropping the least recently used one beyond memory_entries"""
+        self.memory[key] = metadata
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _touch(self, path: str):
+        """Record a use of the entry for path, writing the batched use times once enough have built up"""
+        self.touched[path] = time_ns()
+        if len(self.touched) >= CACHE_TOUCH_FLUSH_COUNT:
+            self._flush_touched()
+
+    def _flush_touched(self):
+        self.connection.executemany("UPDATE metadata SET last_used = ? WHERE path = ?", [(last_used, path) for path, last_used in self.touched.items()])
+        self.touched.clear()
+
+    def _evict(self):
+        """Delete the least recently used entries beyond max_entries"""
+        self._flush_touched()
+        entry_count = self.connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        if entry_count > self.max_entries:
+            self.connection.execute("DELETE FROM metadata WHERE path IN (SELECT path FROM metadata ORDER BY last_used LIMIT ?)", (entry_count - self.max_entries,))
+
+    def get(self, path: Union[str, os.PathLike]) -> CachedMetadata:
+        """Return the metadata of a .jxr file, parsing and caching it unless an entry for the file's current size and modification time exists
+        
+        Returned metadata is shared between callers and must not be modified.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        with self.lock:
+            metadata = self.memory.get(key)
+            if metadata is None:
+                row = self.connection.execute("SELECT value FROM metadata WHERE path = ? AND size = ? AND mtime_ns = ?", key).fetchone()
+                if row is not None:
+                    metadata = pickle.loads(row[0])
+            if metadata is not None:
+                self.hits += 1
+                self._remember(key, metadata)
+                self._touch(path)
+                return metadata
+            self.misses += 1
+
+        # Parse without holding the lock so other lookups can carry on meanwhile
+        metadata = load_metadata(path)
+        value = pickle.dumps(metadata, pickle.HIGHEST_PROTOCOL)
+
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO metadata (path, size, mtime_ns, last_used, value) VALUES (?, ?, ?, ?, ?)", (*key, time_ns(), value))
+            self.touched.pop(path, None)
+            self._remember(key, metadata)
+            self.inserts_since_eviction += 1
+            if self.inserts_since_eviction >= CACHE_EVICTION_INTERVAL:
+                self._evict()
+                self.inserts_since_eviction = 0
+
+        return metadata
+
+    def invalidate(self, path: Union[str, os.PathLike]):
+        """Drop any entry for path"""
+        path = os.path.abspath(path)
+        with self.lock:
+            self.connection.execute("DELETE FROM metadata WHERE path = ?", (path,))
+            self.touched.pop(path, None)
+            for key in [key for key in self.memory if key[0] == path]:
+                del self.memory[key]
+
+    def close(self):
+        """Write out pending use times, apply the entry limit and close the database"""
+        with self.lock:
+            self._evict()
+            self.connection.close()
@@ -1,17 +1,22 @@
 """Module to handle the JPEG XR codestream"""
 
-from typing import BinaryIO
+from typing import BinaryIO, Union, Any, Optional
+from struct import Struct
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
 from enum import IntEnum
 
-from bitstring import ConstBitStream
-
 from ._iotools import *
+from ._datatools import *
 
 """
 Exceptions
 """
 class CodestreamSignatureError(Exception): pass
+class CodestreamReservedValueError(Exception): pass
+class CodestreamIndexTableError(Exception): pass
+class CodestreamMissingIndexTableError(Exception): pass
 
 
 """
@@ -19,6 +24,23 @@ Constants
 """
 CODESTREAM_IMAGE_HEADER_SIGNATURE = b"WMPHOTO\x00"
 
+MACROBLOCK_SIZE = 16
+
+# Precompiled record layouts, codestream fields are stored most significant bit first
+CODESTREAM_IMAGE_HEADER_LAYOUT = Struct(">8sI") # signature, flags
+CODESTREAM_SHORT_DIMENSIONS_LAYOUT = Struct(">HH") # width - 1, height - 1
+CODESTREAM_LONG_DIMENSIONS_LAYOUT = Struct(">II") # width - 1, height - 1
+CODESTREAM_TILE_COUNTS_SIZE = 3 # 12 bits each of vertical and horizontal tile count - 1
+CODESTREAM_MARGINS_SIZE = 3 # 6 bits each of top, left, bottom and right margin
+
+MAX_CHANNEL_COUNT = 16
+# Largest image plane header: 8 bits of format and bands, 8 of chroma centering or channel count, 16 of bitdepth parameters, then for each of the 3 bands 3 flag bits, 2 bits of channel mode and a quantizer index per channel
+IMAGE_PLANE_HEADER_MAX_SIZE = (32 + 3 * (3 + 2 + 8 * MAX_CHANNEL_COUNT) + 7) // 8
+INDEX_TABLE_START_CODE = 0x0001
+VLW_MAX_SIZE = 9 # A variable length word is an escape byte followed by at most 8 bytes
+# The scaled quantization step sizes of the chroma DC and LP bands are shifted one bit less than the others
+QUANTIZER_SHIFT = 1
+
 
 """
 Data
@@ -78,6 +100,7 @@ class CodestreamOutputBitdepth(IntEnum):
     BD1BLACK1 = 15
 
 
+@slotted
 @dataclass
 class CodestreamImageHeader:
     """Header of a JPEG XR codestream image"""
@@ -103,7 +126,7 @@ class CodestreamImageHeader:
     height: int
     vertical_tile_count: int
     horizontal_tile_count: int
-    tile_widths: list[int]
+    tile_widths: list[int] # In macroblocks, the last tile's size is not stored and is derived from the image size
     tile_heights: list[int]
     top_margin: int
     left_margin: int
@@ -111,84 +134,213 @@ class CodestreamImageHeader:
     right_margin: int
 
 
+class CodestreamInternalColourFormat(IntEnum):
+    """This enum specifies the colour format the image planes are coded in."""
+    RESERVED = -1
+    YONLY = 0
+    YUV420 = 1
+    YUV422 = 2
+    YUV444 = 3
+    YUVK = 4
+    NCOMPONENT = 6
+
+
+class CodestreamBandsPresent(IntEnum):
+    """This enum specifies which frequency bands are present in an image plane."""
+    RESERVED = -1
+    ALL = 0
+    NO_FLEXBITS = 1
+    NO_HIGHPASS = 2
+    DC_ONLY = 3
+    ISOLATED = 4
+
+
+class CodestreamQuantizerChannelMode(IntEnum):
+    """This enum specifies how quantizer indices are shared between the channels of an image plane.
+    
+    UNIFORM uses one index for every channel
+    SEPARATE uses one index for the luma channel and one for all other channels
+    INDEPENDENT uses one index per channel
+    """
+    UNIFORM = 0
+    SEPARATE = 1
+    INDEPENDENT = 2
+
+
+@slotted
+@dataclass
+class CodestreamQuantizer:
+    """Quantizer of a frequency band, with the index and dequantization step size of each channel"""
+    channel_mode: CodestreamQuantizerChannelMode
+    indices: tuple[int, ...]
+    steps: tuple[int, ...]
+
+
+@slotted
+@dataclass
+class CodestreamImagePlaneHeader:
+    """Header of an image plane of a JPEG XR codestream, the image itself or its' alpha plane
+    
+    Band quantizers are None when they vary per tile, they are then coded in each tile header. Quantizers are shared read only, a band reusing the quantizer of the previous band refers to the same indices.
+    """
+    internal_colour_format: CodestreamInternalColourFormat
+    scaled: bool
+    bands_present: CodestreamBandsPresent
+    channel_count: int
+    chroma_centering_x: int
+    chroma_centering_y: int
+    shift_bits: int # Shift applied to 16 and 32 bit integer samples
+    mantissa_length: int # Parameters of 32 bit float samples
+    exponent_bias: int
+    dc_quantizer: Optional[CodestreamQuantizer]
+    lp_uses_dc_quantizer: bool
+    lp_quantizer: Optional[CodestreamQuantizer]
+    hp_uses_lp_quantizer: bool
+    hp_quantizer: Optional[CodestreamQuantizer]
+    size: int # In bytes, the header is padded to a whole byte
+
+
+@slotted
+@dataclass
+class CodestreamHeaders:
+    """Headers of a JPEG XR codestream, parsed once per image and shared by everything decoding it"""
+    image_header: CodestreamImageHeader
+    image_plane_header: CodestreamImagePlaneHeader
+    alpha_plane_header: Optional[CodestreamImagePlaneHeader]
+    size: int # In bytes, from the start of the codestream to the end of the last plane header
+
+
+class CodestreamBand(IntEnum):
+    """Frequency bands, in the order their packets are stored in a tile in frequency mode"""
+    DC = 0
+    LP = 1
+    HP = 2
+    FLEXBITS = 3
+
+
+@slotted
+@dataclass
+class CodestreamIndexTable:
+    """Location of every packet of the coded tiles of a JPEG XR codestream, one packet per tile in spatial mode and one per band of each tile in frequency mode
+    
+    Packets are stored tile by tile in raster order. Offsets are relative to the source the codestream was read from, absent packets have an offset and size of -1. Without an index table only a codestream holding a single packet can be located.
+    """
+    tiles_offset: int # Start of the coded tiles, index table offsets are relative to it
+    tile_columns: int
+    tile_rows: int
+    packets_per_tile: int
+    packet_offsets: array
+    packet_sizes: array
+
+    def get_packet_index(self, tile_row: int, tile_column: int, band: CodestreamBand = CodestreamBand.DC) -> int:
+        """Return the index of a packet in packet_offsets and packet_sizes"""
+        if not (0 <= tile_row < self.tile_rows and 0 <= tile_column < self.tile_columns and 0 <= band < self.packets_per_tile):
+            raise IndexError(f"No packet for band {band!r} of tile ({tile_row}, {tile_column}) in a {self.tile_rows}x{self.tile_columns} grid of tiles with {self.packets_per_tile} packets each")
+        return (tile_row * self.tile_columns + tile_column) * self.packets_per_tile + band
+
+    def view_packet(self, source: Union[PositionalReader, BinaryIO, bytes, memoryview], tile_row: int, tile_column: int, band: CodestreamBand = CodestreamBand.DC) -> Optional[Union[memoryview, RangeReader]]:
+        """Return a zero copy view of a packet of the codestream held in source, or None if the packet is absent"""
+        if not self.packet_offsets:
+            raise CodestreamMissingIndexTableError("Codestream has no index table, its' packets can only be found by decoding the tiles before them")
+        index = self.get_packet_index(tile_row, tile_column, band)
+        if self.packet_offsets[index] < 0:
+            return None
+        return view_range(as_reader(source), self.packet_offsets[index], self.packet_sizes[index])
+
+
+def get_quantization_step(index: int, scaled: bool, shift: int) -> int:
+    """Return the dequantization step size of a quantizer index"""
+    if index == 0:
+        # Lossless
+        return 1
+    if scaled:
+        if index < 16:
+            return index << shift
+        return (16 + (index & 0xF)) << ((index >> 4) - 1 + shift)
+    if index < 32:
+        return (index + 3) >> 2
+    if index < 48:
+        return (16 + (index & 0xF) + 1) >> 1
+    return (16 + (index & 0xF)) << ((index >> 4) - 3)
+
+
+# Precomputed lookup tables, these avoid scanning the enums for every header read
+QUANTIZATION_STEP_LUT = {(scaled, shift): tuple(get_quantization_step(index, scaled, shift) for index in range(256)) for scaled in (False, True) for shift in (QUANTIZER_SHIFT - 1, QUANTIZER_SHIFT)}
+INTERNAL_COLOUR_FORMAT_LUT = {colour_format.value: colour_format for colour_format in CodestreamInternalColourFormat}
+BANDS_PRESENT_LUT = {bands_present.value: bands_present for bands_present in CodestreamBandsPresent}
+PACKETS_PER_TILE_LUT = {
+    CodestreamBandsPresent.ALL: 4,
+    CodestreamBandsPresent.NO_FLEXBITS: 3,
+    CodestreamBandsPresent.NO_HIGHPASS: 2,
+    CodestreamBandsPresent.DC_ONLY: 1,
+    CodestreamBandsPresent.ISOLATED: 4
+}
+OVERLAP_MODE_LUT = {overlap_mode.value: overlap_mode for overlap_mode in CodestreamOverlapMode}
+OUTPUT_COLOUR_FORMAT_LUT = {colour_format.value: colour_format for colour_format in CodestreamOutputColourFormat}
+OUTPUT_BITDEPTH_LUT = {bitdepth.value: bitdepth for bitdepth in CodestreamOutputBitdepth}
+
+
 """
 Readers
 """
-def read_image_header(stream: BinaryIO) -> CodestreamImageHeader:
-    """Read and verify the image header of a JPEG XR codestream"""
+def parse_image_header(offset: int = 0) -> Parser:
+    """Parser for the image header of a JPEG XR codestream starting at offset, see _iotools.run_parser"""
+    signature, flags = CODESTREAM_IMAGE_HEADER_LAYOUT.unpack((yield offset, CODESTREAM_IMAGE_HEADER_LAYOUT.size))
+    offset += CODESTREAM_IMAGE_HEADER_LAYOUT.size
+
     # Verify signature
-    signature = stream.read(8)
     if signature != CODESTREAM_IMAGE_HEADER_SIGNATURE:
-        raise CodestreamSignatureError(f"Invalid JPEG XR codestream signature: {CODESTREAM_IMAGE_HEADER_SIGNATURE}")
-    
-    # Read bit based data
-    bit_stream = ConstBitStream(stream.read(4))
+        raise CodestreamSignatureError(f"Invalid JPEG XR codestream signature: {signature}")
     
-    reserved_b = bit_stream.read("uint:4")
-    hard_tiling = bit_stream.read("bool")
-    reserved_c = bit_stream.read("uint:3")
-    tiling = bit_stream.read("bool")
-    frequency_mode_layout = bit_stream.read("bool")
-    spatial_transform = CodestreamSpatialTransform(bit_stream.read("uint:3"))
-    index_table_present = bit_stream.read("bool")
-
-    overlap_mode = CodestreamOverlapMode.NONE # XXX: undefined behaviour when overlap_mode is not one of the known values?
-    overlap_mode_raw = bit_stream.read("uint:2")
-    if overlap_mode_raw in iter(CodestreamOverlapMode):
-        overlap_mode = CodestreamOverlapMode(overlap_mode_raw)
-
-    short_header = bit_stream.read("bool")
-    long_word = bit_stream.read("bool")
-    windowing = bit_stream.read("bool")
-    trim_flexbits = bit_stream.read("bool")
-    reserved_d = bit_stream.read("uint:1")
-    red_blue_not_swapped = bit_stream.read("bool")
-    premultiplied_alpha = bit_stream.read("bool")
-    alpha_image_plane = bit_stream.read("bool")
-
-    output_colour_format = CodestreamOutputColourFormat.RESERVED
-    output_colour_format_raw = bit_stream.read("uint:4")
-    if output_colour_format_raw in iter(CodestreamOutputColourFormat):
-        output_colour_format = CodestreamOutputColourFormat(output_colour_format_raw)
-    
-    output_bitdepth = CodestreamOutputBitdepth.RESERVED
-    output_bitdepth_raw = bit_stream.read("uint:4")
-    if output_bitdepth_raw in iter(CodestreamOutputBitdepth):
-        output_bitdepth = CodestreamOutputBitdepth(output_bitdepth_raw)
-
-    # Read width and height (in macro blocks)
-    width = 0
-    height = 0
-    if short_header:
-        width = read_uint16(stream) + 1
-        height = read_uint16(stream) + 1
-    else:
-        width = read_uint32(stream) + 1
-        height = read_uint32(stream) + 1
+    # Decode the bit based data from the 32 bit flags word
+    reserved_b = flags >> 28
+    hard_tiling = bool(flags >> 27 & 1)
+    reserved_c = flags >> 24 & 0x7
+    tiling = bool(flags >> 23 & 1)
+    frequency_mode_layout = bool(flags >> 22 & 1)
+    spatial_transform = CodestreamSpatialTransform(flags >> 19 & 0x7)
+    index_table_present = bool(flags >> 18 & 1)
+    overlap_mode = OVERLAP_MODE_LUT.get(flags >> 16 & 0x3, CodestreamOverlapMode.NONE) # XXX: undefined behaviour when overlap_mode is not one of the known values?
+    short_header = bool(flags >> 15 & 1)
+    long_word = bool(flags >> 14 & 1)
+    windowing = bool(flags >> 13 & 1)
+    trim_flexbits = bool(flags >> 12 & 1)
+    reserved_d = flags >> 11 & 1
+    red_blue_not_swapped = bool(flags >> 10 & 1)
+    premultiplied_alpha = bool(flags >> 9 & 1)
+    alpha_image_plane = bool(flags >> 8 & 1)
+    output_colour_format = OUTPUT_COLOUR_FORMAT_LUT.get(flags >> 4 & 0xF, CodestreamOutputColourFormat.RESERVED)
+    output_bitdepth = OUTPUT_BITDEPTH_LUT.get(flags & 0xF, CodestreamOutputBitdepth.RESERVED)
+
+    # Read width and height (in pixels) along with the tile counts
+    dimensions_layout = CODESTREAM_SHORT_DIMENSIONS_LAYOUT if short_header else CODESTREAM_LONG_DIMENSIONS_LAYOUT
+    tile_counts_size = CODESTREAM_TILE_COUNTS_SIZE if tiling else 0
+    dimensions = yield offset, dimensions_layout.size + tile_counts_size
+    offset += dimensions_layout.size + tile_counts_size
+
+    width_minus1, height_minus1 = dimensions_layout.unpack_from(dimensions)
+    width = width_minus1 + 1
+    height = height_minus1 + 1
     
-    # Read tile count and dimensions
+    # Read tile count and dimensions, the size of the last tile in each direction is implied
     vertical_tile_count = 0
     horizontal_tile_count = 0
     if tiling:
-        vertical_tile_count = read_uint12(stream) + 1
-        horizontal_tile_count = read_uint12(stream) + 1
+        tile_counts = int.from_bytes(dimensions[dimensions_layout.size:], "big")
+        vertical_tile_count = (tile_counts >> 12) + 1
+        horizontal_tile_count = (tile_counts & 0xFFF) + 1
     
-    tile_widths = []
-    tile_heights = []
-    for _ in range(vertical_tile_count):
-        tile_width = 0
-        if short_header:
-            tile_width = read_uint8(stream)
-        else:
-            tile_width = read_uint16(stream)
-        tile_widths.append(tile_width)
-    for _ in range(horizontal_tile_count):
-        tile_height = 0
-        if short_header:
-            tile_height = read_uint8(stream)
-        else:
-            tile_height = read_uint16(stream)
-        tile_heights.append(tile_height)
+    # Read the tile dimensions along with the margin info
+    tile_size_format = "B" if short_header else "H"
+    explicit_tile_widths = max(vertical_tile_count - 1, 0)
+    explicit_tile_heights = max(horizontal_tile_count - 1, 0)
+    tile_sizes_layout = Struct(f">{explicit_tile_widths}{tile_size_format}{explicit_tile_heights}{tile_size_format}")
+    margins_size = CODESTREAM_MARGINS_SIZE if windowing else 0
+    tile_sizes_and_margins = yield offset, tile_sizes_layout.size + margins_size
+
+    tile_sizes = tile_sizes_layout.unpack_from(tile_sizes_and_margins)
+    tile_widths = list(tile_sizes[:explicit_tile_widths])
+    tile_heights = list(tile_sizes[explicit_tile_widths:])
 
     # Read margin info
     top_margin = 0
@@ -196,12 +348,236 @@ def read_image_header(stream: BinaryIO) -> CodestreamImageHeader:
     bottom_margin = 0
     right_margin = 0
     if windowing:
-        bit_stream = ConstBitStream(stream.read(3))
-        
-        top_margin = bit_stream.read("uint:6")
-        left_margin = bit_stream.read("uint:6")
-        bottom_margin = bit_stream.read("uint:6")
-        right_margin = bit_stream.read("uint:6")
+        margins = int.from_bytes(tile_sizes_and_margins[tile_sizes_layout.size:], "big")
+        top_margin = margins >> 18
+        left_margin = margins >> 12 & 0x3F
+        bottom_margin = margins >> 6 & 0x3F
+        right_margin = margins & 0x3F
+
+    # Derive the size of the last tiles from the size of the image in macroblocks
+    if tiling:
+        tile_widths.append(-(-(width + left_margin + right_margin) // MACROBLOCK_SIZE) - sum(tile_widths))
+        tile_heights.append(-(-(height + top_margin + bottom_margin) // MACROBLOCK_SIZE) - sum(tile_heights))
 
     return CodestreamImageHeader(reserved_b, hard_tiling, reserved_c, tiling, frequency_mode_layout, spatial_transform, index_table_present, overlap_mode, short_header, long_word, windowing, trim_flexbits, reserved_d, red_blue_not_swapped, premultiplied_alpha, alpha_image_plane, output_colour_format, output_bitdepth, width, height, vertical_tile_count, horizontal_tile_count, tile_widths, tile_heights, top_margin, left_margin, bottom_margin, right_margin)
 
+
+def get_image_header_size(image_header: CodestreamImageHeader) -> int:
+    """Return the size, in bytes, of a codestream image header"""
+    dimensions_layout = CODESTREAM_SHORT_DIMENSIONS_LAYOUT if image_header.short_header else CODESTREAM_LONG_DIMENSIONS_LAYOUT
+    size = CODESTREAM_IMAGE_HEADER_LAYOUT.size + dimensions_layout.size
+    if image_header.tiling:
+        tile_size_size = 1 if image_header.short_header else 2
+        size += CODESTREAM_TILE_COUNTS_SIZE + (image_header.vertical_tile_count - 1 + image_header.horizontal_tile_count - 1) * tile_size_size
+    if image_header.windowing:
+        size += CODESTREAM_MARGINS_SIZE
+    return size
+
+
+def decode_quantizer(bits: BitReader, channel_count: int, scaled: bool, shifted_chroma: bool) -> CodestreamQuantizer:
+    """Decode the quantizer indices of a band and look up the step size of each channel"""
+    channel_mode = CodestreamQuantizerChannelMode.UNIFORM
+    if channel_count > 1:
+        channel_mode_raw = bits.read(2)
+        if channel_mode_raw > CodestreamQuantizerChannelMode.INDEPENDENT:
+            raise CodestreamReservedValueError(f"Reserved quantizer channel mode: {channel_mode_raw}")
+        channel_mode = CodestreamQuantizerChannelMode(channel_mode_raw)
+
+    luma_index = bits.read(8)
+    if channel_mode == CodestreamQuantizerChannelMode.UNIFORM:
+        indices = (luma_index,) * channel_count
+    elif channel_mode == CodestreamQuantizerChannelMode.SEPARATE:
+        indices = (luma_index,) + (bits.read(8),) * (channel_count - 1)
+    else:
+        indices = (luma_index, *bits.read_run(channel_count - 1, 8))
+
+    return make_quantizer(channel_mode, indices, scaled, shifted_chroma)
+
+
+def make_quantizer(channel_mode: CodestreamQuantizerChannelMode, indices: tuple[int, ...], scaled: bool, shifted_chroma: bool) -> CodestreamQuantizer:
+    """Build a quantizer from the index of each channel, the chroma step sizes of the DC and LP bands are shifted a bit less when scaled"""
+    luma_steps = QUANTIZATION_STEP_LUT[scaled, QUANTIZER_SHIFT]
+    chroma_steps = QUANTIZATION_STEP_LUT[scaled, QUANTIZER_SHIFT - 1] if shifted_chroma else luma_steps
+    steps = (luma_steps[indices[0]],) + tuple(chroma_steps[index] for index in indices[1:])
+    return CodestreamQuantizer(channel_mode, indices, steps)
+
+
+def decode_image_plane_header(buffer: Union[bytes, memoryview], image_header: CodestreamImageHeader) -> CodestreamImagePlaneHeader:
+    """Decode the image plane header at the start of buffer"""
+    bits = BitReader(buffer)
+    internal_colour_format_raw = bits.read(3)
+    internal_colour_format = INTERNAL_COLOUR_FORMAT_LUT.get(internal_colour_format_raw, CodestreamInternalColourFormat.RESERVED)
+    if internal_colour_format == CodestreamInternalColourFormat.RESERVED:
+        raise CodestreamReservedValueError(f"Reserved internal colour format: {internal_colour_format_raw}")
+    scaled = bits.read_bool()
+    bands_present = BANDS_PRESENT_LUT.get(bits.read(4), CodestreamBandsPresent.RESERVED)
+
+    # Colour format parameters
+    channel_count = 3
+    chroma_centering_x = 0
+    chroma_centering_y = 0
+    if internal_colour_format == CodestreamInternalColourFormat.YONLY:
+        channel_count = 1
+    elif internal_colour_format == CodestreamInternalColourFormat.YUVK:
+        channel_count = 4
+    elif internal_colour_format == CodestreamInternalColourFormat.NCOMPONENT:
+        channel_count = bits.read(4) + 1
+        bits.skip(4)
+    else:
+        fields = bits.read(8)
+        if internal_colour_format == CodestreamInternalColourFormat.YUV420:
+            chroma_centering_x = fields >> 4 & 0x7
+            chroma_centering_y = fields & 0x7
+        elif internal_colour_format == CodestreamInternalColourFormat.YUV422:
+            chroma_centering_x = fields >> 4 & 0x7
+
+    # Bitdepth parameters
+    shift_bits = 0
+    mantissa_length = 0
+    exponent_bias = 0
+    if image_header.output_bitdepth in (CodestreamOutputBitdepth.BD16, CodestreamOutputBitdepth.BD16S, CodestreamOutputBitdepth.BD32S):
+        shift_bits = bits.read(8)
+    elif image_header.output_bitdepth == CodestreamOutputBitdepth.BD32F:
+        mantissa_length = bits.read(8)
+        exponent_bias = bits.read(8)
+
+    # Band quantizers, each band either has its' own, reuses the previous band's or has one per tile
+    dc_quantizer = decode_quantizer(bits, channel_count, scaled, True) if bits.read_bool() else None
+    lp_uses_dc_quantizer = True
+    lp_quantizer = dc_quantizer
+    hp_uses_lp_quantizer = True
+    hp_quantizer = None
+    if bands_present != CodestreamBandsPresent.DC_ONLY:
+        lp_uses_dc_quantizer = bits.read_bool()
+        if not lp_uses_dc_quantizer:
+            lp_quantizer = decode_quantizer(bits, channel_count, scaled, True) if bits.read_bool() else None
+        if bands_present != CodestreamBandsPresent.NO_HIGHPASS:
+            hp_uses_lp_quantizer = bits.read_bool()
+            if not hp_uses_lp_quantizer:
+                hp_quantizer = decode_quantizer(bits, channel_count, scaled, False) if bits.read_bool() else None
+            elif lp_quantizer is not None:
+                # The HP band doesn't shift chroma step sizes, so the LP indices get their own steps
+                hp_quantizer = make_quantizer(lp_quantizer.channel_mode, lp_quantizer.indices, scaled, False)
+    bits.align()
+
+    return CodestreamImagePlaneHeader(internal_colour_format, scaled, bands_present, channel_count, chroma_centering_x, chroma_centering_y, shift_bits, mantissa_length, exponent_bias, dc_quantizer, lp_uses_dc_quantizer, lp_quantizer, hp_uses_lp_quantizer, hp_quantizer, bits.tell() >> 3)
+
+
+def parse_image_plane_header(offset: int, image_header: CodestreamImageHeader, codestream_end: Optional[int] = None) -> Parser:
+    """Parser for the image plane header at offset, the largest possible header is read in one go unless it would run past codestream_end"""
+    size = IMAGE_PLANE_HEADER_MAX_SIZE if codestream_end is None else min(IMAGE_PLANE_HEADER_MAX_SIZE, codestream_end - offset)
+    return decode_image_plane_header((yield offset, size), image_header)
+
+
+def parse_codestream_headers(offset: int = 0, codestream_size: Optional[int] = None) -> Parser:
+    """Parser for the image header and image plane headers of a JPEG XR codestream starting at offset, codestream_size is the size of the source from offset when known"""
+    codestream_end = None if codestream_size is None else offset + codestream_size
+    image_header = yield from parse_image_header(offset)
+    plane_offset = offset + get_image_header_size(image_header)
+    image_plane_header = yield from parse_image_plane_header(plane_offset, image_header, codestream_end)
+    plane_offset += image_plane_header.size
+
+    alpha_plane_header = None
+    if image_header.alpha_image_plane:
+        alpha_plane_header = yield from parse_image_plane_header(plane_offset, image_header, codestream_end)
+        plane_offset += alpha_plane_header.size
+
+    return CodestreamHeaders(image_header, image_plane_header, alpha_plane_header, plane_offset - offset)
+
+
+def decode_variable_length_word(buffer: Union[bytes, memoryview], position: int) -> tuple[Optional[int], int]:
+    """Decode the escapable variable length word at position, returns its' value, or None for an escape code, and the position after it"""
+    first_byte = buffer[position]
+    if first_byte < 0xFB:
+        return first_byte << 8 | buffer[position + 1], position + 2
+    if first_byte == 0xFB:
+        return int.from_bytes(buffer[position + 1:position + 5], "big"), position + 5
+    if first_byte == 0xFC:
+        return int.from_bytes(buffer[position + 1:position + 9], "big"), position + 9
+    return None, position + 1
+
+
+def parse_index_table(offset: int, headers: CodestreamHeaders, codestream_end: int) -> Parser:
+    """Parser for the index table at offset, where the codestream headers end, and the bytes following it up to the coded tiles
+    
+    The largest possible table is read in one go unless it would run past codestream_end.
+    """
+    image_header = headers.image_header
+    tile_columns = max(image_header.vertical_tile_count, 1)
+    tile_rows = max(image_header.horizontal_tile_count, 1)
+    packets_per_tile = 1
+    if image_header.frequency_mode_layout:
+        bands_present = headers.image_plane_header.bands_present
+        if bands_present not in PACKETS_PER_TILE_LUT:
+            raise CodestreamReservedValueError(f"Reserved bands present: {bands_present}")
+        packets_per_tile = PACKETS_PER_TILE_LUT[bands_present]
+    packet_count = tile_columns * tile_rows * packets_per_tile
+    entry_count = packet_count if image_header.index_table_present else 0
+
+    size = 2 * image_header.index_table_present + (entry_count + 1) * VLW_MAX_SIZE
+    buffer = memoryview((yield offset, min(size, codestream_end - offset)))
+    try:
+        position = 0
+        relative_offsets = []
+        if image_header.index_table_present:
+            if UINT16["big"].unpack_from(buffer)[0] != INDEX_TABLE_START_CODE:
+                raise CodestreamIndexTableError(f"Invalid index table start code: {bytes(buffer[:2])}")
+            position = 2
+            for _ in range(entry_count):
+                relative_offset, position = decode_variable_length_word(buffer, position)
+                relative_offsets.append(relative_offset)
+
+        # The bytes between here and the coded tiles, holding profile and level info
+        subsequent_size, position = decode_variable_length_word(buffer, position)
+    except IndexError:
+        raise CodestreamIndexTableError(f"Index table runs past the end of the codestream at offset {codestream_end}") from None
+    tiles_offset = offset + position + (subsequent_size or 0)
+
+    packet_offsets = array("q")
+    packet_sizes = array("q")
+    if relative_offsets:
+        packet_offsets.extend(-1 if relative_offset is None else tiles_offset + relative_offset for relative_offset in relative_offsets)
+        # Each packet runs up to the next packet in the codestream, the last one to its' end
+        starts = sorted({packet_offset for packet_offset in packet_offsets if packet_offset >= 0})
+        if starts and starts[-1] > codestream_end:
+            raise CodestreamIndexTableError(f"Index table points past the end of the codestream: {starts[-1]} > {codestream_end}")
+        starts.append(codestream_end)
+        packet_sizes.extend(-1 if packet_offset < 0 else starts[bisect_right(starts, packet_offset)] - packet_offset for packet_offset in packet_offsets)
+    elif packet_count == 1:
+        packet_offsets.append(tiles_offset)
+        packet_sizes.append(codestream_end - tiles_offset)
+
+    return CodestreamIndexTable(tiles_offset, tile_columns, tile_rows, packets_per_tile, packet_offsets, packet_sizes)
+
+
+def read_image_header(source: Union[PositionalReader, BinaryIO, bytes, memoryview], offset: Optional[int] = None) -> CodestreamImageHeader:
+    """Read and verify the image header of a JPEG XR codestream starting at offset
+    
+    The source can be a PositionalReader or anything as_reader can wrap, such as a .jxr file, the codestream returned by jxrfile.read_image_bitstream or the view returned by JXRImageFileDirectory.image_bitstream. Without an offset streams are read from their current position, other sources from their start.
+    """
+    return run_parser(as_reader(source), parse_image_header(get_source_offset(source, offset)))
+
+
+async def read_image_header_async(source: Any, offset: int = 0) -> CodestreamImageHeader:
+    """Read and verify the image header of a JPEG XR codestream starting at offset from an async source, see _iotools.as_async_reader"""
+    return await run_parser_async(as_async_reader(source), parse_image_header(offset))
+
+
+def read_codestream_headers(source: Union[PositionalReader, BinaryIO, bytes, memoryview], offset: Optional[int] = None) -> CodestreamHeaders:
+    """Read the image header and image plane headers of a JPEG XR codestream starting at offset, see read_image_header"""
+    offset = get_source_offset(source, offset)
+    reader = as_reader(source)
+    size = reader.get_size()
+    return run_parser(reader, parse_codestream_headers(offset, None if size is None else size - offset))
+
+
+def read_index_table(source: Union[PositionalReader, BinaryIO, bytes, memoryview], headers: Optional[CodestreamHeaders] = None, offset: Optional[int] = None) -> CodestreamIndexTable:
+    """Read the index table of a JPEG XR codestream starting at offset, its' headers are read first unless given, see read_image_header"""
+    offset = get_source_offset(source, offset)
+    reader = as_reader(source)
+    codestream_end = reader.get_size()
+    if codestream_end is None:
+        raise ValueError("The index table can only be read from a source of known size")
+    if headers is None:
+        headers = run_parser(reader, parse_codestream_headers(offset, codestream_end - offset))
+    return run_parser(reader, parse_index_table(offset + headers.size, headers, codestream_end))
@@ -1,10 +1,15 @@
 """Module to read and write .jxr format container files"""
 
-from typing import BinaryIO, Any
-from dataclasses import dataclass
+from typing import BinaryIO, Any, Optional, Union, Iterator, AsyncIterator
+from os import PathLike
+from mmap import mmap
+from struct import Struct, iter_unpack, unpack_from
+from array import array
+from dataclasses import dataclass, field, replace
 from enum import IntEnum, Enum
 
 from ._iotools import *
+from ._datatools import *
 
 """
 Exceptions
@@ -13,17 +18,31 @@ class JXRFileSignatureError(Exception): """Exception caused when the .jxr file s
 class JXRReaderFileVersionError(Exception): """Exception caused when the reader encounters a file version greater than its' max supported version."""
 class JXRDuplicateIFDEntryError(Exception): """Exception caused when the reader encounters an entry with an ifd tag that has already been used."""
 class JXRMissingRequiredIFDEntryError(Exception): """Exception caused when a required ifd field tag is missing from an ifd."""
+class JXREntryDataError(Exception): """Exception caused when an ifd entry holds less data than its' element type and count require, or has a type or count its' field doesn't allow."""
+class JXRDetachedIFDError(Exception): """Exception caused when the bitstreams of an ifd are viewed without the source it was read from, such as after unpickling it."""
+class JXRWriteError(Exception): """Exception caused when .jxr file data can't be written as given."""
+class JXRColumnarEntryError(Exception): """Exception caused when an entry can't be packed into columnar form because its' out of line data has replaced its' data offset."""
+class JXRLimitExceededError(Exception): """Exception caused when reading a .jxr file would exceed one of the reader's resource limits."""
+class JXROffsetOutOfBoundsError(Exception): """Exception caused when an offset or size in a .jxr file points outside of the file."""
+class JXRCyclicIFDChainError(Exception): """Exception caused when the chain of ifds loops back onto an ifd which has already been read."""
 
 
 """
 Constants
 """
 READER_MAX_SUPPORTED_FILE_VERSION = 1
+WRITER_FILE_VERSION = 1
 JXR_SIGNATURE = b"II\xbc"
 
+# Precompiled record layouts
+JXR_HEADER_IFD_OFFSET_POSITION = 4 # Position of the first ifd offset inside the header
+JXR_HEADER_LAYOUT = Struct("<3sBI") # signature, version, ifd offset
+JXR_IFD_ENTRY_LAYOUT = Struct("<HHI4s") # tag, element type, element count, inline data or data offset
+
 """
 File data
 """
+@slotted
 @dataclass
 class JXRHeader:
     """.jxr file header"""
@@ -44,7 +63,13 @@ class JXRFieldTag(IntEnum):
     DATE_TIME = 0x0132
     ARTIST_NAME = 0x013B
     HOST_COMPUTER = 0x013C
+    XMP_METADATA = 0x02BC
     COPYRIGHT_NOTICE = 0x8298
+    IPTC_NAA_METADATA = 0x83BB
+    PHOTOSHOP_METADATA = 0x8649
+    EXIF_METADATA = 0x8769 # Offset of an EXIF ifd
+    ICC_PROFILE = 0x8773
+    GPS_METADATA = 0x8825 # Offset of a GPS ifd
     COLOR_SPACE = 0xA001
     PIXEL_FORMAT = 0xBC01
     SPATIAL_XFRM_PRIMARY = 0xBC02
@@ -54,7 +79,7 @@ class JXRFieldTag(IntEnum):
     IMAGE_WIDTH = 0xBC80
     IMAGE_HEIGHT = 0xBC81
     WIDTH_RESOLUTION = 0xBC82
-    HEIGHT_RESOLUTION = 0xBC3
+    HEIGHT_RESOLUTION = 0xBC83
     IMAGE_OFFSET = 0xBCC0
     IMAGE_BYTE_COUNT = 0xBCC1
     ALPHA_OFFSET = 0xBCC2
@@ -82,24 +107,64 @@ class JXRElementType(IntEnum):
 
     def get_data_size(self) -> int:
         """Return the size, in bytes, of the data type represented by this enum"""
-        DATA_SIZE_LUT = {
-            self.RESERVED: 0,
-            self.BYTE: 1,
-            self.UTF8: 1,
-            self.USHORT: 2,
-            self.ULONG: 4,
-            self.URATIONAL: 8,
-            self.SBYTE: 1,
-            self.UNDEFINED: 1,
-            self.SSHORT: 2,
-            self.SLONG: 4,
-            self.SRATIONAL: 8,
-            self.FLOAT: 4,
-            self.DOUBLE: 8
-        }
-        return DATA_SIZE_LUT[self]
+        return ELEMENT_DATA_SIZE_LUT[self]
+
+
+# Precomputed lookup tables, these avoid scanning the enums for every entry read
+FIELD_TAG_LUT = {tag.value: tag for tag in JXRFieldTag}
+ELEMENT_TYPE_LUT = {element_type.value: element_type for element_type in JXRElementType}
+ELEMENT_DATA_SIZE_LUT = {
+    JXRElementType.RESERVED: 0,
+    JXRElementType.BYTE: 1,
+    JXRElementType.UTF8: 1,
+    JXRElementType.USHORT: 2,
+    JXRElementType.ULONG: 4,
+    JXRElementType.URATIONAL: 8,
+    JXRElementType.SBYTE: 1,
+    JXRElementType.UNDEFINED: 1,
+    JXRElementType.SSHORT: 2,
+    JXRElementType.SLONG: 4,
+    JXRElementType.SRATIONAL: 8,
+    JXRElementType.FLOAT: 4,
+    JXRElementType.DOUBLE: 8
+}
+# struct format characters of the numeric element types, rationals are pairs of these
+ELEMENT_FORMAT_LUT = {
+    JXRElementType.SBYTE: "b",
+    JXRElementType.USHORT: "H",
+    JXRElementType.SSHORT: "h",
+    JXRElementType.ULONG: "I",
+    JXRElementType.SLONG: "i",
+    JXRElementType.URATIONAL: "I",
+    JXRElementType.SRATIONAL: "i",
+    JXRElementType.FLOAT: "f",
+    JXRElementType.DOUBLE: "d"
+}
+
+
+def decode_element_data(element_type: JXRElementType, element_count: int, data: bytes) -> object:
+    """Decode the elements held in data
+    
+    Single elements decode to a scalar and arrays to a tuple, BYTE arrays and UNDEFINED data are left as bytes, UTF8 decodes to a str and rationals to (numerator, denominator) pairs.
+    Numeric arrays are unpacked by a single struct call rather than element by element.
+    """
+    if element_type == JXRElementType.UTF8:
+        return bytes(data).split(b"\0", 1)[0].decode("utf-8", errors="replace")
+    if element_type == JXRElementType.BYTE:
+        return data[0] if element_count == 1 else bytes(data)
+    if element_type not in ELEMENT_FORMAT_LUT:
+        # UNDEFINED and unknown element types are opaque
+        return bytes(data)
+
+    format_char = ELEMENT_FORMAT_LUT[element_type]
+    if element_type in (JXRElementType.URATIONAL, JXRElementType.SRATIONAL):
+        values = tuple(iter_unpack(f"<2{format_char}", data))
+    else:
+        values = unpack_from(f"<{element_count}{format_char}", data)
+    return values[0] if element_count == 1 else values
 
 
+@slotted
 @dataclass
 class JXRImageFileDirectoryEntry:
     """An entry in the image file directory"""
@@ -107,20 +172,90 @@ class JXRImageFileDirectoryEntry:
     element_type: JXRElementType
     element_count: int
     data: bytes
+    _decoded: tuple = field(init=False, repr=False, compare=False) # (data, decoded value) of the last decode
+
+    def __post_init__(self):
+        self._decoded = None
+
+    def get_data_size(self) -> int:
+        """Return the size, in bytes, of the data held by this entry"""
+        return ELEMENT_DATA_SIZE_LUT[self.element_type] * self.element_count
+
+    def is_out_of_line(self) -> bool:
+        """Return whether the data of this entry is stored outside of the ifd, at the offset held in the entry's data field"""
+        return self.get_data_size() > 4
 
     def decode(self) -> object:
-        """Decode the entry data into its' associated JXRFieldTag type"""
-        pass
+        """Decode the entry data into its' associated python type (see decode_element_data), the result is cached until data is replaced"""
+        data = self.data
+        if self._decoded is not None and self._decoded[0] is data:
+            return self._decoded[1]
+
+        data_size = self.get_data_size()
+        if len(data) < data_size:
+            raise JXREntryDataError(f"{self.tag.name} entry holds {len(data)} bytes of data, {self.element_count} {self.element_type.name} elements need {data_size}")
+        value = decode_element_data(self.element_type, self.element_count, data[:data_size])
+        self._decoded = (data, value)
+        return value
+
 
+class JXRLazyImageFileDirectoryEntry(JXRImageFileDirectoryEntry):
+    """An image file directory entry whose out of line data is only read from the source, and cached, on first access"""
+    __slots__ = ("data_offset", "_reader", "_data")
 
+    def __init__(self, tag: JXRFieldTag, element_type: JXRElementType, element_count: int, data_offset: int, reader: PositionalReader):
+        self.data_offset = data_offset
+        self._reader = reader
+        super().__init__(tag, element_type, element_count, None)
+
+    def __repr__(self) -> str:
+        data = repr(self._data) if self._data is not None else f"<{self.get_data_size()} bytes at offset {self.data_offset}>"
+        return f"{self.__class__.__name__}(tag={self.tag!r}, element_type={self.element_type!r}, element_count={self.element_count!r}, data={data})"
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = read_exact_at(self._reader, self.data_offset, self.get_data_size())
+        return self._data
+
+    @data.setter
+    def data(self, data: bytes):
+        self._data = data
+
+
+@slotted
 @dataclass
 class JXRImageFileDirectory:
     """.jxr image file directory (ifd)"""
     entry_count: int
     entries: dict[JXRFieldTag, JXRImageFileDirectoryEntry]
     next_ifd_offset: int
+    data_read_count: int = 0 # Number of reads issued to fetch out of line entry data
+    reader: Optional[PositionalReader] = field(default=None, repr=False, compare=False) # Source the ifd was read from, its' bitstreams are viewed through it
+
+    def __getstate__(self) -> tuple:
+        # The reader is tied to an open source so it isn't pickled
+        return self.entry_count, self.entries, self.next_ifd_offset, self.data_read_count
+
+    def __setstate__(self, state: tuple):
+        self.entry_count, self.entries, self.next_ifd_offset, self.data_read_count = state
+        self.reader = None
+
+    def image_bitstream(self) -> Union[memoryview, RangeReader]:
+        """Return a zero copy view of the image codestream, see view_bitstream"""
+        return view_bitstream(self.get_reader(), self, JXRFieldTag.IMAGE_OFFSET, JXRFieldTag.IMAGE_BYTE_COUNT)
+
+    def alpha_bitstream(self) -> Optional[Union[memoryview, RangeReader]]:
+        """Return a zero copy view of the alpha plane codestream, or None if the image has no separate alpha plane, see view_bitstream"""
+        return view_bitstream(self.get_reader(), self, JXRFieldTag.ALPHA_OFFSET, JXRFieldTag.ALPHA_BYTE_COUNT)
 
+    def get_reader(self) -> PositionalReader:
+        if self.reader is None:
+            raise JXRDetachedIFDError("IFD isn't attached to the source it was read from, read its' bitstreams with read_image_bitstream and read_alpha_bitstream instead")
+        return self.reader
 
+
+@slotted
 @dataclass
 class JXRFile:
     """.jxr file data"""
@@ -128,92 +263,674 @@ class JXRFile:
     image_file_directories: list[JXRImageFileDirectory]
 
 
+@dataclass
+class JXRReadLimits:
+    """Resource limits applied while reading .jxr file data, so hostile or corrupt files fail fast instead of exhausting memory or CPU"""
+    max_ifd_count: int = 1024
+    max_entry_data_size: int = 64 * 1024 * 1024 # Largest out of line data of a single entry
+    max_metadata_size: int = 256 * 1024 * 1024 # Total size of the ifd entry tables and out of line entry data in the file
+    file_size: Optional[int] = None # Offsets and sizes are checked against this, readers fill it in from the source when known
+
+    def check_bounds(self, offset: int, size: int, description: str):
+        """Raise JXROffsetOutOfBoundsError if the range lies outside of the file"""
+        if self.file_size is not None and offset + size > self.file_size:
+            raise JXROffsetOutOfBoundsError(f"{description} at offset {offset} with size {size} lies outside of the file ({self.file_size} bytes)")
+
+    def for_reader(self, reader: PositionalReader) -> "JXRReadLimits":
+        """Return these limits with the file size filled in from the reader, if it isn't set already"""
+        if self.file_size is not None:
+            return self
+        return replace(self, file_size=reader.get_size())
+
+
+DEFAULT_READ_LIMITS = JXRReadLimits()
+
+
 """
-Data readers
+Data parsers
+
+Parsers yield (offset, size) read requests and are sent back the bytes read (see _iotools.run_parser), the readers below run them over blocking or async sources.
 """
-def read_header(stream: BinaryIO) -> JXRHeader:
-    """Read and verify .jxr file header"""
+def parse_header(offset: int = 0) -> Parser:
+    """Parser for the .jxr file header at offset, verifying its' signature"""
+    signature, version, ifd_offset = JXR_HEADER_LAYOUT.unpack((yield offset, JXR_HEADER_LAYOUT.size))
+
     # Verify signature
-    signature = stream.read(3)
     if signature != JXR_SIGNATURE:
         raise JXRFileSignatureError(f"Invalid .jxr file signature: {signature}")
-    
-    # Read header data
-    version = read_uint8(stream)
-    ifd_offset = read_uint32(stream)
 
     return JXRHeader(version, ifd_offset)
 
 
-def read_image_file_directory_entry(stream: BinaryIO) -> JXRImageFileDirectoryEntry:
-    """Read a .jxr image file directory entry"""
-    # Need to ensure that the tag we read exists, otherwise set it to RESERVED and ignore
-    tag = JXRFieldTag.RESERVED
-    tag_raw = read_uint16(stream)
-    if tag_raw in iter(JXRFieldTag):
-        tag = JXRFieldTag(tag_raw)
-    
-    # Need to ensure that the type we read exists, otherwise set it to RESERVED and ignore
-    element_type = JXRElementType.RESERVED
-    element_type_raw = read_uint16(stream)
-    if element_type_raw in iter(JXRElementType):
-        element_type = JXRElementType(element_type_raw)
-    element_count = read_uint32(stream)
-    
-    # if the size of the total data in bytes is smaller than 4 bytes treat the next field as the data, otherwise use it as an offset to the data 
-    elements_size = element_type.get_data_size() * element_count
-    data = None
-    if elements_size > 4:
-        data_offset = read_uint32(stream)
-        stream_position = stream.tell()
-        stream.seek(data_offset)
-        data = stream.read(elements_size)
-        stream.seek(stream_position)
-    else:
-        data = stream.read(4)
+def decode_image_file_directory_entry(tag_raw: int, element_type_raw: int, element_count: int, data: bytes) -> JXRImageFileDirectoryEntry:
+    """Build a .jxr image file directory entry from its' unpacked fields, out of line entries keep their data offset until their data is read"""
+    # Need to ensure that the tag and type we read exist, otherwise set them to RESERVED and ignore
+    tag = FIELD_TAG_LUT.get(tag_raw, JXRFieldTag.RESERVED)
+    element_type = ELEMENT_TYPE_LUT.get(element_type_raw, JXRElementType.RESERVED)
 
     return JXRImageFileDirectoryEntry(tag, element_type, element_count, data)
 
 
-def read_image_file_directory(stream: BinaryIO) -> JXRImageFileDirectory:
-    """Read a .jxr image file directory"""
-    entry_count = read_uint16(stream)
+def parse_out_of_line_data(entries: list[JXRImageFileDirectoryEntry], max_gap: int = COALESCE_MAX_GAP) -> Parser:
+    """Parser replacing the data offsets of out of line entries with the data they point to, returns the number of reads issued
+    
+    The data ranges of all entries are merged so that neighbouring payloads are fetched by a single read.
+    """
+    # if the size of the total data in bytes is smaller than 4 bytes the data is stored inline, otherwise it is an offset to the data
+    out_of_line_entries = [entry for entry in entries if entry.is_out_of_line()]
+    if not out_of_line_entries:
+        return 0
+
+    ranges = [(UINT32["little"].unpack(entry.data)[0], entry.get_data_size()) for entry in out_of_line_entries]
+    range_data, read_count = yield from parse_ranges(ranges, max_gap)
+    for entry, data in zip(out_of_line_entries, range_data):
+        entry.data = data
+
+    return read_count
+
+
+def parse_image_file_directory_entry(offset: int) -> Parser:
+    """Parser for the .jxr image file directory entry at offset"""
+    entry = decode_image_file_directory_entry(*JXR_IFD_ENTRY_LAYOUT.unpack((yield offset, JXR_IFD_ENTRY_LAYOUT.size)))
+    yield from parse_out_of_line_data([entry])
+    return entry
+
+
+def parse_image_file_directory(offset: int, max_gap: int = COALESCE_MAX_GAP, read_data: bool = True, limits: JXRReadLimits = DEFAULT_READ_LIMITS, metadata_budget: Optional[int] = None) -> Parser:
+    """Parser for the .jxr image file directory at offset, out of line entry data lying within max_gap bytes is fetched with a single read
+    
+    When read_data is not set out of line entries keep their data offset in place of their data. The ifd's entry table and out of line data must fit in metadata_budget, limits.max_metadata_size unless given.
+    """
+    if metadata_budget is None:
+        metadata_budget = limits.max_metadata_size
+    limits.check_bounds(offset, UINT16["little"].size, "IFD")
+    entry_count = UINT16["little"].unpack((yield offset, UINT16["little"].size))[0]
+
+    # Read the whole entry table along with the next ifd offset in one go, then decode the entries in bulk
+    entry_table_size = entry_count * JXR_IFD_ENTRY_LAYOUT.size
+    metadata_size = entry_table_size
+    if metadata_size > metadata_budget:
+        raise JXRLimitExceededError(f"IFD entry table of {entry_count} entries exceeds the metadata size limit: {limits.max_metadata_size}")
+    limits.check_bounds(offset + UINT16["little"].size, entry_table_size + 4, "IFD entry table")
+    entry_table = yield offset + UINT16["little"].size, entry_table_size + 4
 
-    # Read ifd entries
     entries = {}
-    for _ in range(entry_count):
-        entry = read_image_file_directory_entry(stream)
+    out_of_line_entries = []
+    for entry_fields in JXR_IFD_ENTRY_LAYOUT.iter_unpack(memoryview(entry_table)[:entry_table_size]):
+        entry = decode_image_file_directory_entry(*entry_fields)
         if entry.tag in entries:
             # this is undefined behaviour
             raise JXRDuplicateIFDEntryError(f"Duplicate IFD entry, this is undefined behaviour: {entry}, first occurence: {entries[entry.tag]}")
         entries[entry.tag] = entry
 
+        # Check out of line data against the limits before any of it is read
+        data_size = ELEMENT_DATA_SIZE_LUT[entry.element_type] * entry.element_count
+        if data_size > 4:
+            if data_size > limits.max_entry_data_size:
+                raise JXRLimitExceededError(f"IFD entry data exceeds the entry data size limit: {limits.max_entry_data_size}, entry: {entry}")
+            metadata_size += data_size
+            if metadata_size > metadata_budget:
+                raise JXRLimitExceededError(f"IFD entry data exceeds the metadata size limit: {limits.max_metadata_size}, entry: {entry}")
+            limits.check_bounds(UINT32["little"].unpack(entry.data)[0], data_size, f"{entry.tag!r} entry data")
+            out_of_line_entries.append(entry)
+
+    data_read_count = 0
+    if read_data:
+        data_read_count = yield from parse_out_of_line_data(out_of_line_entries, max_gap)
+
     # Validate this ifd contains all required tags
     for required_tag in [JXRFieldTag.PIXEL_FORMAT, JXRFieldTag.IMAGE_WIDTH, JXRFieldTag.IMAGE_HEIGHT, JXRFieldTag.IMAGE_OFFSET, JXRFieldTag.IMAGE_BYTE_COUNT]:
         if required_tag not in entries:
             raise JXRMissingRequiredIFDEntryError(f"IFD is missing a requird entry: {required_tag}, IFD entries: {entries}")
 
-    next_ifd_offset = read_uint32(stream)
-    return JXRImageFileDirectory(entry_count, entries, next_ifd_offset)
+    next_ifd_offset = UINT32["little"].unpack_from(entry_table, entry_table_size)[0]
+    return JXRImageFileDirectory(entry_count, entries, next_ifd_offset, data_read_count)
+
 
+def get_metadata_size(ifd: JXRImageFileDirectory) -> int:
+    """Return the size of an ifd's entry table and out of line entry data, as counted against JXRReadLimits.max_metadata_size"""
+    return ifd.entry_count * JXR_IFD_ENTRY_LAYOUT.size + sum(entry.get_data_size() for entry in ifd.entries.values() if entry.is_out_of_line())
 
-def read(stream: BinaryIO) -> JXRFile:
-    """Read .jxr file data from a stream"""
-    # Read header    
-    header = read_header(stream)
+
+class JXRImageFileDirectoryChain:
+    """Walks the chain of ifds in a .jxr file one ifd at a time
+    
+    The chain is rejected as soon as it loops back onto an ifd already read or grows beyond limits.max_ifd_count, each ifd is given whatever is left of limits.max_metadata_size.
+    """
+
+    def __init__(self, first_ifd_offset: int, limits: JXRReadLimits = DEFAULT_READ_LIMITS):
+        self.next_ifd_offset = first_ifd_offset
+        self.limits = limits
+        self.metadata_budget = limits.max_metadata_size
+        self.visited_offsets = set()
+
+    def has_next(self) -> bool:
+        # The first ifd is always read, after that an offset of 0 ends the chain
+        return not self.visited_offsets or self.next_ifd_offset != 0
+
+    def parse_next(self, max_gap: int = COALESCE_MAX_GAP, read_data: bool = True) -> Parser:
+        """Parser for the next ifd in the chain"""
+        ifd_offset = self.next_ifd_offset
+        if ifd_offset in self.visited_offsets:
+            raise JXRCyclicIFDChainError(f"IFD chain loops back to the IFD at offset {ifd_offset}")
+        if len(self.visited_offsets) >= self.limits.max_ifd_count:
+            raise JXRLimitExceededError(f"IFD chain exceeds the IFD count limit: {self.limits.max_ifd_count}")
+        self.visited_offsets.add(ifd_offset)
+
+        ifd = yield from parse_image_file_directory(ifd_offset, max_gap, read_data, self.limits, self.metadata_budget)
+        self.metadata_budget -= get_metadata_size(ifd)
+        self.next_ifd_offset = ifd.next_ifd_offset
+        return ifd
+
+
+def parse_verified_header() -> Parser:
+    """Parser for the .jxr file header, additionally checking the file version is supported"""
+    header = yield from parse_header()
     if header.version > READER_MAX_SUPPORTED_FILE_VERSION:
         raise JXRReaderFileVersionError(f".jxr file exceeds the reader's max supported file version: {header.version} (max: {READER_MAX_SUPPORTED_FILE_VERSION})")
 
-    # Read ifds
-    stream.seek(header.ifd_offset)
+    return header
 
-    image_file_directories = []
-    ifd = read_image_file_directory(stream)
-    image_file_directories.append(ifd)
 
-    while ifd.next_ifd_offset != 0:
-        ifd = read_image_file_directory(stream)
+def parse_file(max_gap: int = COALESCE_MAX_GAP, read_data: bool = True, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> Parser:
+    """Parser for .jxr file data, the header followed by the chain of ifds"""
+    header = yield from parse_verified_header()
+
+    image_file_directories = []
+    chain = JXRImageFileDirectoryChain(header.ifd_offset, limits)
+    while chain.has_next():
+        ifd = yield from chain.parse_next(max_gap, read_data)
         image_file_directories.append(ifd)
 
     return JXRFile(header, image_file_directories)
 
+
+"""
+Data readers
+
+Readers accept a PositionalReader or anything as_reader can wrap (a binary file or stream, a file descriptor or a buffer) and read at explicit offsets, so one source can be shared by many threads.
+"""
+def make_entries_lazy(ifd: JXRImageFileDirectory, reader: PositionalReader):
+    """Replace the out of line entries of an ifd read without its' data by entries which read their data from reader on first access"""
+    for tag, entry in ifd.entries.items():
+        if entry.is_out_of_line():
+            data_offset = UINT32["little"].unpack(entry.data)[0]
+            ifd.entries[tag] = JXRLazyImageFileDirectoryEntry(entry.tag, entry.element_type, entry.element_count, data_offset, reader)
+
+
+def attach_image_file_directory(ifd: JXRImageFileDirectory, reader: PositionalReader, lazy: bool):
+    """Attach an ifd to the reader it was read from, making its' out of line entries lazy if it was read without its' data"""
+    ifd.reader = reader
+    if lazy:
+        make_entries_lazy(ifd, reader)
+
+
+def read_header(source: Union[PositionalReader, BinaryIO], offset: Optional[int] = None) -> JXRHeader:
+    """Read and verify .jxr file header at offset, without one streams are read from their current position and other sources from their start"""
+    return run_parser(as_reader(source), parse_header(get_source_offset(source, offset)))
+
+
+def read_image_file_directory_entry(source: Union[PositionalReader, BinaryIO], offset: int) -> JXRImageFileDirectoryEntry:
+    """Read the .jxr image file directory entry at offset"""
+    return run_parser(as_reader(source), parse_image_file_directory_entry(offset))
+
+
+def read_image_file_directory(source: Union[PositionalReader, BinaryIO], offset: int, max_gap: int = COALESCE_MAX_GAP, lazy: bool = False, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRImageFileDirectory:
+    """Read the .jxr image file directory at offset, out of line entry data lying within max_gap bytes is fetched with a single read
+    
+    When lazy is set out of line entry data is not read here, instead each entry records its' data offset and reads its' data on first access.
+    """
+    reader = as_reader(source)
+    ifd = run_parser(reader, parse_image_file_directory(offset, max_gap, not lazy, limits.for_reader(reader)))
+    attach_image_file_directory(ifd, reader, lazy)
+    return ifd
+
+
+def iter_image_file_directories(source: Union[PositionalReader, BinaryIO], lazy: bool = False, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> Iterator[JXRImageFileDirectory]:
+    """Yield each .jxr image file directory in the file as it is read, following the chain of next ifd offsets
+    
+    Nothing past an ifd is read until the next one is requested, so consumers only interested in the first pages can stop early.
+    """
+    reader = as_reader(source)
+    limits = limits.for_reader(reader)
+    header = run_parser(reader, parse_verified_header())
+
+    chain = JXRImageFileDirectoryChain(header.ifd_offset, limits)
+    while chain.has_next():
+        ifd = run_parser(reader, chain.parse_next(read_data=not lazy))
+        attach_image_file_directory(ifd, reader, lazy)
+        yield ifd
+
+
+def read(source: Union[PositionalReader, BinaryIO], lazy: bool = False, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRFile:
+    """Read .jxr file data from a source
+    
+    When lazy is set only the header and ifd entry tables are read up front, out of line entry data is read when first accessed so the source must be kept open until then.
+    """
+    reader = as_reader(source)
+    jxr_file = run_parser(reader, parse_file(read_data=not lazy, limits=limits.for_reader(reader)))
+    for ifd in jxr_file.image_file_directories:
+        attach_image_file_directory(ifd, reader, lazy)
+
+    return jxr_file
+
+
+def read_buffer(source: Union[str, PathLike, mmap, bytes, bytearray, memoryview], lazy: bool = False, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRFile:
+    """Read .jxr file data straight from a path, mmap, bytes, bytearray or memoryview
+    
+    Paths are memory mapped rather than read. Out of line entry data is returned as memoryview slices of the buffer instead of copies, so the buffer is kept alive for as long as the entries are.
+    """
+    return read(BufferReader(open_buffer(source)), lazy, limits)
+
+
+def read_stream(source: Union[StreamingReader, BinaryIO], memory_limit: int = STREAM_MEMORY_LIMIT, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRFile:
+    """Read .jxr file data from a forward only stream, such as a pipe, socket or HTTP response body
+    
+    The stream is consumed only as far as the metadata reaches. Bytes which entries or later ifds may still point back to are held by a StreamingReader, spilling to a temporary file beyond memory_limit bytes. Once the ifd chain has been read only the image and alpha bitstreams are retained, pass in a StreamingReader to read them afterwards with read_image_bitstream and read_alpha_bitstream.
+    """
+    reader = source if isinstance(source, StreamingReader) else StreamingReader(source, memory_limit)
+    jxr_file = read(reader, limits=limits)
+
+    bitstream_ranges = []
+    for ifd in jxr_file.image_file_directories:
+        for offset_tag, byte_count_tag in [(JXRFieldTag.IMAGE_OFFSET, JXRFieldTag.IMAGE_BYTE_COUNT), (JXRFieldTag.ALPHA_OFFSET, JXRFieldTag.ALPHA_BYTE_COUNT)]:
+            if offset_tag in ifd.entries and byte_count_tag in ifd.entries:
+                bitstream_ranges.append((decode_uint_entry(ifd.entries[offset_tag]), decode_uint_entry(ifd.entries[byte_count_tag])))
+    reader.retain(bitstream_ranges)
+
+    return jxr_file
+
+
+"""
+Async data readers
+
+These take an AsyncPositionalReader, or anything as_async_reader can wrap, and await each read so many files can be parsed concurrently from one event loop.
+"""
+async def read_header_async(source: Any) -> JXRHeader:
+    """Read and verify .jxr file header from an async source"""
+    return await run_parser_async(as_async_reader(source), parse_header())
+
+
+async def read_image_file_directory_async(source: Any, offset: int, max_gap: int = COALESCE_MAX_GAP, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRImageFileDirectory:
+    """Read the .jxr image file directory at offset from an async source"""
+    return await run_parser_async(as_async_reader(source), parse_image_file_directory(offset, max_gap, limits=limits))
+
+
+async def iter_image_file_directories_async(source: Any, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> AsyncIterator[JXRImageFileDirectory]:
+    """Yield each .jxr image file directory in the file as it is read from an async source, following the chain of next ifd offsets"""
+    reader = as_async_reader(source)
+    header = await run_parser_async(reader, parse_verified_header())
+
+    chain = JXRImageFileDirectoryChain(header.ifd_offset, limits)
+    while chain.has_next():
+        yield await run_parser_async(reader, chain.parse_next())
+
+
+async def read_async(source: Any, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRFile:
+    """Read .jxr file data from an async source, the size of async sources isn't known so set limits.file_size to have offsets checked against it"""
+    return await run_parser_async(as_async_reader(source), parse_file(limits=limits))
+
+
+"""
+Bitstream readers
+"""
+UINT_ELEMENT_TYPES = {JXRElementType.BYTE, JXRElementType.USHORT, JXRElementType.ULONG}
+
+
+def decode_uint_entry(entry: JXRImageFileDirectoryEntry) -> int:
+    """Decode the value of a single element BYTE, USHORT or ULONG entry"""
+    if entry.element_type not in UINT_ELEMENT_TYPES or entry.element_count != 1:
+        raise JXREntryDataError(f"{entry.tag.name} entry must be a single BYTE, USHORT or ULONG, got {entry.element_count} {entry.element_type.name} elements")
+    return entry.decode()
+
+
+def read_bitstream(source: Union[PositionalReader, BinaryIO], ifd: JXRImageFileDirectory, offset_tag: JXRFieldTag, byte_count_tag: JXRFieldTag) -> Optional[bytes]:
+    """Read the bitstream located by the offset and byte count entries of an ifd, returns None if the ifd has no such entries
+    
+    Buffer sources return a memoryview slice of the buffer rather than a copy.
+    """
+    if offset_tag not in ifd.entries or byte_count_tag not in ifd.entries:
+        return None
+
+    return read_exact_at(as_reader(source), decode_uint_entry(ifd.entries[offset_tag]), decode_uint_entry(ifd.entries[byte_count_tag]))
+
+
+def view_bitstream(source: Union[PositionalReader, BinaryIO], ifd: JXRImageFileDirectory, offset_tag: JXRFieldTag, byte_count_tag: JXRFieldTag) -> Optional[Union[memoryview, RangeReader]]:
+    """Return a zero copy view of the bitstream located by the offset and byte count entries of an ifd, returns None if the ifd has no such entries
+    
+    Buffer sources give a memoryview slice of the buffer, any other source a RangeReader limited to the bitstream with offsets starting at the codestream. Either can be handed to codestream.read_image_header or write as is.
+    """
+    if offset_tag not in ifd.entries or byte_count_tag not in ifd.entries:
+        return None
+
+    reader = as_reader(source)
+    offset, size = decode_uint_entry(ifd.entries[offset_tag]), decode_uint_entry(ifd.entries[byte_count_tag])
+    JXRReadLimits(file_size=reader.get_size()).check_bounds(offset, size, f"{offset_tag.name} bitstream")
+    return view_range(reader, offset, size)
+
+
+def read_image_bitstream(source: Union[PositionalReader, BinaryIO], ifd: JXRImageFileDirectory) -> bytes:
+    """Read the image codestream of an ifd"""
+    return read_bitstream(source, ifd, JXRFieldTag.IMAGE_OFFSET, JXRFieldTag.IMAGE_BYTE_COUNT)
+
+
+def read_alpha_bitstream(source: Union[PositionalReader, BinaryIO], ifd: JXRImageFileDirectory) -> Optional[bytes]:
+    """Read the alpha plane codestream of an ifd, returns None if the image has no separate alpha plane"""
+    return read_bitstream(source, ifd, JXRFieldTag.ALPHA_OFFSET, JXRFieldTag.ALPHA_BYTE_COUNT)
+
+
+"""
+Data writers
+"""
+BITSTREAM_ENTRY_TAGS = {JXRFieldTag.IMAGE_OFFSET, JXRFieldTag.IMAGE_BYTE_COUNT, JXRFieldTag.ALPHA_OFFSET, JXRFieldTag.ALPHA_BYTE_COUNT}
+SUB_IFD_ENTRY_TAGS = {JXRFieldTag.EXIF_METADATA, JXRFieldTag.GPS_METADATA} # Point at ifds elsewhere in the file, which write doesn't carry over
+
+
+def make_ulong_entry(tag: JXRFieldTag, value: int) -> JXRImageFileDirectoryEntry:
+    """Build a single element ULONG entry"""
+    return JXRImageFileDirectoryEntry(tag, JXRElementType.ULONG, 1, UINT32["little"].pack(value))
+
+
+def get_packed_data_size(entry: JXRImageFileDirectoryEntry) -> int:
+    """Return the size, in bytes, an entry's out of line data takes when packed, data is padded to keep following offsets word aligned"""
+    data_size = entry.get_data_size()
+    if data_size <= 4:
+        return 0
+    return data_size + (data_size & 1)
+
+
+def get_packed_image_file_directory_size(entries: list[JXRImageFileDirectoryEntry]) -> int:
+    """Return the size, in bytes, of an ifd entry table followed by the out of line data of its' entries"""
+    return 2 + len(entries) * JXR_IFD_ENTRY_LAYOUT.size + 4 + sum(get_packed_data_size(entry) for entry in entries)
+
+
+def pack_image_file_directory(ifd_offset: int, entries: list[JXRImageFileDirectoryEntry], next_ifd_offset: int) -> bytearray:
+    """Pack an ifd entry table followed by the out of line data of its' entries, as laid out at ifd_offset"""
+    table = bytearray(UINT16["little"].pack(len(entries)))
+    data = bytearray()
+    data_offset = ifd_offset + 2 + len(entries) * JXR_IFD_ENTRY_LAYOUT.size + 4
+    for entry in entries:
+        entry_data = entry.data
+        data_size = entry.get_data_size()
+        if len(entry_data) < data_size:
+            raise JXREntryDataError(f"{entry.tag.name} entry holds {len(entry_data)} bytes of data, {entry.element_count} {entry.element_type.name} elements need {data_size}")
+
+        if data_size > 4:
+            value = UINT32["little"].pack(data_offset + len(data))
+            data += entry_data[:data_size]
+            data += bytes(get_packed_data_size(entry) - data_size)
+        else:
+            value = bytes(entry_data[:data_size]).ljust(4, b"\0")
+        table += JXR_IFD_ENTRY_LAYOUT.pack(entry.tag.value, entry.element_type.value, entry.element_count, value)
+
+    table += UINT32["little"].pack(next_ifd_offset)
+    return table + data
+
+
+def as_payload_list(payload: Union[Optional[Payload], list[Optional[Payload]]], ifd_count: int, description: str) -> list[Optional[Payload]]:
+    """Return the payload of each ifd, a single payload is only accepted for a file with a single ifd"""
+    payloads = payload if isinstance(payload, list) else [payload]
+    if len(payloads) != ifd_count:
+        raise JXRWriteError(f"Got {len(payloads)} {description} payloads for {ifd_count} ifds")
+    return payloads
+
+
+def write(stream: BinaryIO, jxr_file: JXRFile, image_payload: Union[Payload, list[Payload]], alpha_payload: Union[Optional[Payload], list[Optional[Payload]]] = None) -> JXRFile:
+    """Write a .jxr file to stream, returns the file data as written
+    
+    The header, each ifd and its' out of line entry data are laid out in one forward pass, followed by the image and alpha bitstreams of each ifd. Payloads are buffers or positional readers, a list gives one payload per ifd, an alpha_payload of None leaves every ifd without alpha. They are written as they are, file ranges (such as a RangeReader over a FileReader) are copied by the kernel where possible so the bitstreams are never buffered whole.
+    The bitstream offset and byte count entries are rewritten to match the new layout. Entries with a RESERVED tag or element type can't be written back as their raw values aren't kept, nor can EXIF and GPS ifd offsets as the ifds they point at aren't copied, these raise JXRWriteError rather than being lost silently. Remove them from the ifd to write the rest, update_metadata keeps them as it leaves unchanged entries in place.
+    """
+    ifd_count = len(jxr_file.image_file_directories)
+    image_payloads = as_payload_list(image_payload, ifd_count, "image")
+    alpha_payloads = [None] * ifd_count if alpha_payload is None else as_payload_list(alpha_payload, ifd_count, "alpha")
+
+    # Entries without their bitstream entries, which depend on the layout, sorted by tag as the ifd entry table requires
+    entry_lists = []
+    for index, ifd in enumerate(jxr_file.image_file_directories):
+        for tag, entry in ifd.entries.items():
+            if tag == JXRFieldTag.RESERVED or entry.element_type == JXRElementType.RESERVED:
+                raise JXRWriteError(f"IFD {index} holds an entry with an unknown tag or element type, it can't be written back as its' raw tag and type aren't kept: {entry}")
+            if tag in SUB_IFD_ENTRY_TAGS:
+                raise JXRWriteError(f"IFD {index} holds a {tag.name} entry, the ifd it points at isn't copied by write")
+        entries = [entry for tag, entry in ifd.entries.items() if tag not in BITSTREAM_ENTRY_TAGS]
+        entry_lists.append(entries)
+
+    # Lay out the ifds after the header, then the bitstreams after the ifds
+    bitstream_offset = JXR_HEADER_LAYOUT.size
+    for entries, image, alpha in zip(entry_lists, image_payloads, alpha_payloads):
+        bitstream_offset += get_packed_image_file_directory_size(entries) + JXR_IFD_ENTRY_LAYOUT.size * (2 if alpha is None else 4)
+    for entries, image, alpha in zip(entry_lists, image_payloads, alpha_payloads):
+        image_size = get_payload_size(image)
+        entries += [make_ulong_entry(JXRFieldTag.IMAGE_OFFSET, bitstream_offset), make_ulong_entry(JXRFieldTag.IMAGE_BYTE_COUNT, image_size)]
+        bitstream_offset += image_size
+        if alpha is not None:
+            alpha_size = get_payload_size(alpha)
+            entries += [make_ulong_entry(JXRFieldTag.ALPHA_OFFSET, bitstream_offset), make_ulong_entry(JXRFieldTag.ALPHA_BYTE_COUNT, alpha_size)]
+            bitstream_offset += alpha_size
+        entries.sort(key=lambda entry: entry.tag)
+
+    # Metadata is packed into one buffer and written at once, it is small next to the bitstreams
+    header = JXRHeader(WRITER_FILE_VERSION, JXR_HEADER_LAYOUT.size)
+    metadata = bytearray(JXR_HEADER_LAYOUT.pack(JXR_SIGNATURE, header.version, header.ifd_offset))
+    image_file_directories = []
+    for index, entries in enumerate(entry_lists):
+        ifd_offset = len(metadata)
+        next_ifd_offset = ifd_offset + get_packed_image_file_directory_size(entries) if index + 1 < ifd_count else 0
+        metadata += pack_image_file_directory(ifd_offset, entries, next_ifd_offset)
+        image_file_directories.append(JXRImageFileDirectory(len(entries), {entry.tag: entry for entry in entries}, next_ifd_offset))
+    stream.write(metadata)
+
+    for image, alpha in zip(image_payloads, alpha_payloads):
+        write_payload(stream, image)
+        if alpha is not None:
+            write_payload(stream, alpha)
+
+    return JXRFile(header, image_file_directories)
+
+
+"""
+Metadata updates
+
+These patch the metadata of an existing file, the bitstreams are never read or moved so the cost only depends on the size of the metadata.
+"""
+def make_utf8_entry(tag: JXRFieldTag, text: str) -> JXRImageFileDirectoryEntry:
+    """Build a nul terminated UTF8 entry"""
+    data = text.encode("utf-8") + b"\0"
+    return JXRImageFileDirectoryEntry(tag, JXRElementType.UTF8, len(data), data)
+
+
+def get_entry_record_data_size(record: tuple) -> int:
+    """Return the size, in bytes, of the data of a raw (tag, element type, element count, value) entry record"""
+    return ELEMENT_DATA_SIZE_LUT[ELEMENT_TYPE_LUT.get(record[1], JXRElementType.RESERVED)] * record[2]
+
+
+def get_entry_value(entry: JXRImageFileDirectoryEntry) -> tuple[bytes, int]:
+    """Return the data of an entry truncated to its' data size, along with that size"""
+    data = entry.data
+    data_size = entry.get_data_size()
+    if len(data) < data_size:
+        raise JXREntryDataError(f"{entry.tag.name} entry holds {len(data)} bytes of data, {entry.element_count} {entry.element_type.name} elements need {data_size}")
+    return bytes(data[:data_size]), data_size
+
+
+def plan_in_place_update(ifd_offset: int, records: list[tuple], changes: dict[JXRFieldTag, Optional[JXRImageFileDirectoryEntry]]) -> Optional[list[tuple[int, bytes]]]:
+    """Return the (offset, data) writes updating an ifd in place, or None when the changes don't fit in it
+    
+    Entries can only be replaced in place, as adding or removing one changes the size of the entry table. Out of line data is written over the entry's old data when it is no larger, otherwise it is carved from the front of the PADDING_DATA entry's data.
+    """
+    indices = {record[0]: index for index, record in enumerate(records)}
+    # Removing entries which aren't there is a no op
+    changes = {tag: entry for tag, entry in changes.items() if entry is not None or tag.value in indices}
+    if JXRFieldTag.PADDING_DATA in changes or any(entry is None or tag.value not in indices for tag, entry in changes.items()):
+        return None
+
+    # Slack left in the PADDING_DATA entry's out of line data
+    padding_index = indices.get(JXRFieldTag.PADDING_DATA.value)
+    slack_offset, slack_size = 0, 0
+    if padding_index is not None and get_entry_record_data_size(records[padding_index]) > 4:
+        slack_offset, slack_size = UINT32["little"].unpack(records[padding_index][3])[0], get_entry_record_data_size(records[padding_index])
+
+    data_writes = []
+    table_writes = []
+    slack_used = 0
+    for tag, entry in changes.items():
+        index = indices[tag.value]
+        record = records[index]
+        data, data_size = get_entry_value(entry)
+        if data_size <= 4:
+            value = data.ljust(4, b"\0")
+        elif data_size <= get_entry_record_data_size(record) and get_entry_record_data_size(record) > 4:
+            value = record[3]
+            data_writes.append((UINT32["little"].unpack(value)[0], data))
+        elif slack_used + data_size <= slack_size:
+            value = UINT32["little"].pack(slack_offset + slack_used)
+            data_writes.append((slack_offset + slack_used, data))
+            slack_used += get_packed_data_size(entry)
+        else:
+            return None
+        table_writes.append((ifd_offset + 2 + index * JXR_IFD_ENTRY_LAYOUT.size, JXR_IFD_ENTRY_LAYOUT.pack(tag.value, entry.element_type.value, entry.element_count, value)))
+
+    if slack_used:
+        # Shrink the padding to the slack left over, a remainder small enough to be inline is abandoned
+        padding_tag, padding_type, padding_count, _ = records[padding_index]
+        element_size = ELEMENT_DATA_SIZE_LUT[ELEMENT_TYPE_LUT.get(padding_type, JXRElementType.RESERVED)]
+        slack_used = min(slack_size, -(-slack_used // element_size) * element_size)
+        padding_count = (slack_size - slack_used) // element_size
+        if padding_count * element_size > 4:
+            value = UINT32["little"].pack(slack_offset + slack_used)
+        else:
+            padding_count, value = 0, bytes(4)
+        table_writes.append((ifd_offset + 2 + padding_index * JXR_IFD_ENTRY_LAYOUT.size, JXR_IFD_ENTRY_LAYOUT.pack(padding_tag, padding_type, padding_count, value)))
+
+    # Data is written before the entries pointing at it
+    return data_writes + table_writes
+
+
+def plan_appended_update(file_size: int, pointer_offset: int, records: list[tuple], next_ifd_offset: int, changes: dict[JXRFieldTag, Optional[JXRImageFileDirectoryEntry]]) -> list[tuple[int, bytes]]:
+    """Return the (offset, data) writes appending an updated copy of an ifd to the end of the file and pointing pointer_offset at it
+    
+    Unchanged entries are copied as they are, keeping their out of line data where it already lies, so only the entry table and the changed data are written.
+    """
+    records = {record[0]: record for record in records}
+    for tag in changes:
+        records.pop(tag.value, None)
+    changed_entries = [entry for entry in changes.values() if entry is not None]
+
+    ifd_offset = file_size + (file_size & 1)
+    table_size = 2 + (len(records) + len(changed_entries)) * JXR_IFD_ENTRY_LAYOUT.size + 4
+    data = bytearray()
+    for entry in changed_entries:
+        entry_data, data_size = get_entry_value(entry)
+        if data_size <= 4:
+            value = entry_data.ljust(4, b"\0")
+        else:
+            value = UINT32["little"].pack(ifd_offset + table_size + len(data))
+            data += entry_data + bytes(get_packed_data_size(entry) - data_size)
+        records[entry.tag.value] = (entry.tag.value, entry.element_type.value, entry.element_count, value)
+
+    # The entry table must stay sorted by tag
+    table = bytearray(UINT16["little"].pack(len(records)))
+    for tag in sorted(records):
+        table += JXR_IFD_ENTRY_LAYOUT.pack(*records[tag])
+    table += UINT32["little"].pack(next_ifd_offset)
+
+    # The pointer to the ifd is only switched once the new copy has been written
+    return [(file_size, bytes(ifd_offset - file_size) + table + data), (pointer_offset, UINT32["little"].pack(ifd_offset))]
+
+
+def update_metadata(path: Union[str, PathLike], changes: dict[JXRFieldTag, Optional[JXRImageFileDirectoryEntry]], ifd_index: int = 0, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> bool:
+    """Apply changes to the entries of an ifd of the .jxr file at path without rewriting the file, returns whether the ifd was updated in place
+    
+    changes maps field tags to their new entry, or to None to remove the entry. When every change replaces an existing entry and its' data fits, either in the entry's old data or in the PADDING_DATA entry's slack, the ifd is patched in place. Otherwise an updated copy of the ifd is appended to the file and the header (or the previous ifd) is pointed at it.
+    """
+    if JXRFieldTag.RESERVED in changes:
+        raise JXRWriteError("RESERVED entries can't be written as their raw tag isn't known")
+    for tag, entry in changes.items():
+        # The in place and appended updates would otherwise disagree on which entry the change replaces
+        if entry is not None and entry.tag != tag:
+            raise JXRWriteError(f"Change to the {tag.name} entry holds a {entry.tag.name} entry")
+
+    with open(path, "r+b") as file:
+        reader = FileReader(file)
+        limits = limits.for_reader(reader)
+        header = run_parser(reader, parse_verified_header())
+
+        # Walk the chain up to the ifd, keeping track of where the offset pointing at it is stored
+        chain = JXRImageFileDirectoryChain(header.ifd_offset, limits)
+        pointer_offset = JXR_HEADER_IFD_OFFSET_POSITION
+        for index in range(ifd_index + 1):
+            if not chain.has_next():
+                raise JXRWriteError(f"File has no ifd at index {ifd_index}, it has {index}")
+            ifd_offset = chain.next_ifd_offset
+            ifd = run_parser(reader, chain.parse_next(read_data=False))
+            if index < ifd_index:
+                pointer_offset = ifd_offset + 2 + ifd.entry_count * JXR_IFD_ENTRY_LAYOUT.size
+
+        entry_table = read_exact_at(reader, ifd_offset + 2, ifd.entry_count * JXR_IFD_ENTRY_LAYOUT.size)
+        records = list(JXR_IFD_ENTRY_LAYOUT.iter_unpack(entry_table))
+
+        writes = plan_in_place_update(ifd_offset, records, changes)
+        in_place = writes is not None
+        if not in_place:
+            writes = plan_appended_update(reader.get_size(), pointer_offset, records, ifd.next_ifd_offset, changes)
+
+        for offset, data in writes:
+            file.seek(offset)
+            file.write(data)
+
+    return in_place
+
+class JXRColumnarEntries:
+    """The entries of many ifds packed into parallel arrays, for keeping the metadata of very many files in memory
+
+    Each entry costs 12 bytes rather than several python objects. Entries hold the inline data or data offset stored in their ifd entry table, not their out of line data, so ifds must be read lazily (or without their data) before being appended.
+    """
+
+    def __init__(self):
+        # Per ifd
+        self.entry_starts = array("I", [0]) # Index of each ifd's first entry, followed by the total entry count
+        self.entry_counts = array("I")
+        self.next_ifd_offsets = array("I")
+        # Per entry
+        self.tags = array("H")
+        self.element_types = array("H")
+        self.element_counts = array("I")
+        self.values = array("I") # Inline data or data offset, as stored in the entry table
+
+    def __len__(self) -> int:
+        return len(self.entry_counts)
+
+    def append_image_file_directory(self, ifd: JXRImageFileDirectory) -> int:
+        """Pack the entries of an ifd, returns its' index"""
+        uint32 = UINT32["little"]
+        for entry in ifd.entries.values():
+            if isinstance(entry, JXRLazyImageFileDirectoryEntry):
+                value = entry.data_offset
+            elif len(entry.data) != 4:
+                raise JXRColumnarEntryError(f"The data of the {entry.tag.name} entry has replaced its' data offset, read the ifd lazily to pack it")
+            else:
+                value = uint32.unpack(entry.data)[0]
+
+            # RESERVED tags and types are stored as 0xFFFF, which maps back to RESERVED when unpacked
+            self.tags.append(entry.tag.value & 0xFFFF)
+            self.element_types.append(entry.element_type.value & 0xFFFF)
+            self.element_counts.append(entry.element_count)
+            self.values.append(value)
+
+        self.entry_starts.append(len(self.tags))
+        self.entry_counts.append(ifd.entry_count)
+        self.next_ifd_offsets.append(ifd.next_ifd_offset)
+        return len(self.entry_counts) - 1
+
+    def get_image_file_directory(self, index: int, reader: Optional[PositionalReader] = None) -> JXRImageFileDirectory:
+        """Unpack the ifd at index, out of line entries read their data from reader on first access if given, otherwise they keep their data offset"""
+        uint32 = UINT32["little"]
+        entries = {}
+        for entry_index in range(self.entry_starts[index], self.entry_starts[index + 1]):
+            entry = decode_image_file_directory_entry(self.tags[entry_index], self.element_types[entry_index], self.element_counts[entry_index], uint32.pack(self.values[entry_index]))
+            if reader is not None and entry.is_out_of_line():
+                entry = JXRLazyImageFileDirectoryEntry(entry.tag, entry.element_type, entry.element_count, self.values[entry_index], reader)
+            entries[entry.tag] = entry
+
+        return JXRImageFileDirectory(self.entry_counts[index], entries, self.next_ifd_offsets[index])
@@ -0,0 +1,73 @@
+"""Module to probe .jxr files for basic image metadata while reading as few bytes as possible"""
+
+from typing import BinaryIO, Union
+from dataclasses import dataclass
+
+from ._iotools import *
+from ._datatools import *
+from .jxrfile import JXRFieldTag, JXRReadLimits, DEFAULT_READ_LIMITS, parse_header, parse_image_file_directory, parse_out_of_line_data, decode_uint_entry
+from .codestream import CodestreamOutputColourFormat, CodestreamOutputBitdepth, parse_image_header
+
+"""
+Constants
+"""
+PROBE_READ_SIZE = 4096 # Size of the speculative read of the file head, and of the codestream head when it lies outside of it
+
+
+"""
+Data
+"""
+@slotted
+@dataclass
+class JXRProbe:
+    """Basic image metadata of a .jxr file, taken from its' first ifd and codestream image header"""
+    width: int
+    height: int
+    pixel_format: bytes
+    output_colour_format: CodestreamOutputColourFormat
+    output_bitdepth: CodestreamOutputBitdepth
+    vertical_tile_count: int
+    horizontal_tile_count: int
+    tile_widths: list[int]
+    tile_heights: list[int]
+    bytes_read: int # Bytes read from the source, including the unused parts of speculative reads
+    read_count: int # Reads issued to the source
+
+
+"""
+Probing
+"""
+def parse_probe(limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> Parser:
+    """Parser for the image metadata of a .jxr file, only the out of line data of the PIXEL_FORMAT entry is read"""
+    header = yield from parse_header()
+    ifd = yield from parse_image_file_directory(header.ifd_offset, read_data=False, limits=limits)
+
+    pixel_format_entry = ifd.entries[JXRFieldTag.PIXEL_FORMAT]
+    yield from parse_out_of_line_data([pixel_format_entry])
+
+    image_header = yield from parse_image_header(decode_uint_entry(ifd.entries[JXRFieldTag.IMAGE_OFFSET]))
+    return JXRProbe(
+        decode_uint_entry(ifd.entries[JXRFieldTag.IMAGE_WIDTH]),
+        decode_uint_entry(ifd.entries[JXRFieldTag.IMAGE_HEIGHT]),
+        bytes(pixel_format_entry.data),
+        image_header.output_colour_format,
+        image_header.output_bitdepth,
+        image_header.vertical_tile_count,
+        image_header.horizontal_tile_count,
+        image_header.tile_widths,
+        image_header.tile_heights,
+        0,
+        0
+    )
+
+
+def probe(source: Union[PositionalReader, BinaryIO], read_size: int = PROBE_READ_SIZE, limits: JXRReadLimits = DEFAULT_READ_LIMITS) -> JXRProbe:
+    """Probe a .jxr file for its' dimensions, pixel format, bit depth and tile layout
+    
+    The file head is fetched with a single speculative read of read_size bytes, if the metadata or codestream header reach beyond it one more read of read_size bytes is usually enough. The bytes read and reads issued are reported so read_size can be tuned.
+    """
+    reader = SpeculativeReader(as_reader(source), read_size)
+    result = run_parser(reader, parse_probe(limits.for_reader(reader)))
+    result.bytes_read = reader.bytes_read
+    result.read_count = reader.read_count
+    return result
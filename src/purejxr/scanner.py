@@ -0,0 +1,162 @@
+"""Module to scan directory trees of .jxr files for image metadata across a process pool"""
+
+from typing import Iterable, Iterator, Optional, TextIO
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from argparse import ArgumentParser
+from time import perf_counter
+import json
+import csv
+import sys
+import os
+
+from .probe import probe
+
+"""
+Constants
+"""
+JXR_FILE_EXTENSIONS = (".jxr", ".wdp", ".hdp")
+SCAN_BATCH_SIZE = 64 # Files probed per task sent to a worker process
+SCAN_RECORD_FIELDS = ["path", "size", "width", "height", "pixel_format", "output_colour_format", "output_bitdepth", "vertical_tile_count", "horizontal_tile_count", "tile_widths", "tile_heights", "error"]
+
+
+"""
+Scanning
+"""
+def iter_paths(roots: Iterable[str], extensions: tuple[str, ...] = JXR_FILE_EXTENSIONS) -> Iterator[str]:
+    """Yield the paths of the files under each root with one of the given extensions, roots which are files are yielded as is"""
+    for root in roots:
+        if not os.path.isdir(root):
+            yield root
+            continue
+
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.lower().endswith(extensions):
+                    yield os.path.join(directory, filename)
+
+
+def scan_file(path: str) -> dict:
+    """Probe one file, returns a record with a field for each of SCAN_RECORD_FIELDS, failures are reported in the error field"""
+    record = dict.fromkeys(SCAN_RECORD_FIELDS)
+    record["path"] = path
+    try:
+        with open(path, "rb") as file:
+            record["size"] = os.fstat(file.fileno()).st_size
+            result = probe(file)
+
+        record["width"] = result.width
+        record["height"] = result.height
+        record["pixel_format"] = result.pixel_format.hex()
+        record["output_colour_format"] = result.output_colour_format.name
+        record["output_bitdepth"] = result.output_bitdepth.name
+        record["vertical_tile_count"] = result.vertical_tile_count
+        record["horizontal_tile_count"] = result.horizontal_tile_count
+        record["tile_widths"] = result.tile_widths
+        record["tile_heights"] = result.tile_heights
+    except Exception as error:
+        record["error"] = f"{type(error).__name__}: {error}"
+
+    return record
+
+
+def scan_batch(paths: list[str]) -> list[dict]:
+    """Probe a batch of files, this is the unit of work sent to the worker processes"""
+    return [scan_file(path) for path in paths]
+
+
+def scan(paths: Iterable[str], workers: Optional[int] = None, batch_size: int = SCAN_BATCH_SIZE) -> Iterator[dict]:
+    """Probe files across a pool of worker processes, yielding each record as soon as its' batch completes
+    
+    Only a couple of batches per worker are in flight at once, so arbitrarily large path iterables are never held in memory.
+    """
+    paths = iter(paths)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        max_pending = workers * 2
+        pending = set()
+        while True:
+            while len(pending) < max_pending:
+                batch = [path for _, path in zip(range(batch_size), paths)]
+                if not batch:
+                    break
+                pending.add(executor.submit(scan_batch, batch))
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+class ScanStats:
+    """Throughput statistics of a scan"""
+
+    def __init__(self):
+        self.start_time = perf_counter()
+        self.file_count = 0
+        self.error_count = 0
+        self.byte_count = 0
+
+    def add(self, record: dict):
+        self.file_count += 1
+        if record["error"] is not None:
+            self.error_count += 1
+        self.byte_count += record["size"] or 0
+
+    def __str__(self) -> str:
+        elapsed = max(perf_counter() - self.start_time, 1e-9)
+        return f"{self.file_count} files ({self.error_count} errors) in {elapsed:.1f}s, {self.file_count / elapsed:.1f} files/s, {self.byte_count / elapsed / 1e6:.1f} MB/s"
+
+
+"""
+Output
+"""
+def write_ndjson(records: Iterable[dict], output: TextIO) -> Iterator[dict]:
+    """Write records as newline delimited JSON, passing each record on once written"""
+    for record in records:
+        output.write(json.dumps(record) + "\n")
+        yield record
+
+
+def write_csv(records: Iterable[dict], output: TextIO) -> Iterator[dict]:
+    """Write records as CSV with a header row, tile sizes are written space separated, passing each record on once written"""
+    writer = csv.DictWriter(output, SCAN_RECORD_FIELDS)
+    writer.writeheader()
+    for record in records:
+        row = dict(record)
+        for field in ["tile_widths", "tile_heights"]:
+            if row[field] is not None:
+                row[field] = " ".join(map(str, row[field]))
+        writer.writerow(row)
+        yield record
+
+
+"""
+Command line
+"""
+def main(args: list[str]):
+    """Entry point of python -m purejxr scan"""
+    parser = ArgumentParser(prog="python -m purejxr scan", description="Scan directory trees of .jxr files and write their metadata as NDJSON or CSV")
+    parser.add_argument("roots", nargs="+", help="directories to walk, or individual files")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="output format (default: ndjson)")
+    parser.add_argument("--output", help="file to write records to (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=SCAN_BATCH_SIZE, help=f"files per worker task (default: {SCAN_BATCH_SIZE})")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between throughput reports on stderr, 0 disables them (default: 5)")
+    options = parser.parse_args(args)
+
+    output = open(options.output, "w", newline="") if options.output else sys.stdout
+    try:
+        writer = write_csv if options.format == "csv" else write_ndjson
+        stats = ScanStats()
+        last_report = perf_counter()
+        for record in writer(scan(iter_paths(options.roots), options.workers, options.batch_size), output):
+            stats.add(record)
+            if options.progress and perf_counter() - last_report >= options.progress:
+                output.flush()
+                print(stats, file=sys.stderr)
+                last_report = perf_counter()
+        print(stats, file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
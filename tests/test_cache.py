@@ -0,0 +1,26 @@
+from pathlib import Path
+import shutil
+
+import pytest
+
+from purejxr import cache, jxrfile
+
+RGB_PATH = Path(__file__).parent / "data" / "rgb_16x16.jxr"
+
+
+def test_cached_ifds_are_detached_from_memory_and_database(tmp_path):
+    path = tmp_path / "image.jxr"
+    shutil.copy(RGB_PATH, path)
+
+    with cache.MetadataCache(tmp_path / "cache.sqlite") as metadata_cache:
+        from_file = metadata_cache.get(path)
+        from_memory = metadata_cache.get(path)
+    with cache.MetadataCache(tmp_path / "cache.sqlite") as metadata_cache:
+        from_database = metadata_cache.get(path)
+        assert metadata_cache.hits == 1
+
+    assert from_memory is from_file
+    for metadata in (from_memory, from_database):
+        assert metadata.image_header.width == 16
+        with pytest.raises(jxrfile.JXRDetachedIFDError):
+            metadata.jxr_file.image_file_directories[0].image_bitstream()
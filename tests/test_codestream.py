@@ -0,0 +1,191 @@
+from pathlib import Path
+import io
+
+import pytest
+
+from purejxr import codestream, jxrfile
+
+DATA_PATH = Path(__file__).parent / "data"
+RGB_PATH = DATA_PATH / "rgb_16x16.jxr" # 16x16 RGB 8 bit, lossless
+RGB_IMAGE_OFFSET = 134
+
+
+"""
+Image header
+"""
+@pytest.mark.parametrize("open_source", [lambda: open(RGB_PATH, "rb"), lambda: io.BytesIO(RGB_PATH.read_bytes())])
+def test_read_image_header_from_stream_position(open_source):
+    with open_source() as stream:
+        stream.seek(RGB_IMAGE_OFFSET)
+        image_header = codestream.read_image_header(stream)
+        assert (image_header.width, image_header.height) == (16, 16)
+        # Streams without pread are read through seeks, which move the stream
+        stream.seek(RGB_IMAGE_OFFSET)
+        assert codestream.read_codestream_headers(stream).image_header == image_header
+        # An explicit offset takes precedence over the stream position
+        assert codestream.read_image_header(stream, RGB_IMAGE_OFFSET) == image_header
+
+
+def test_read_image_header_from_buffer_start():
+    data = RGB_PATH.read_bytes()
+    with pytest.raises(codestream.CodestreamSignatureError):
+        codestream.read_image_header(data)
+    assert codestream.read_image_header(data[RGB_IMAGE_OFFSET:]) == codestream.read_image_header(data, RGB_IMAGE_OFFSET)
+
+
+"""
+Image plane header
+"""
+RGBA_LOSSY_PATH = DATA_PATH / "rgba_16x16_lossy.jxr" # 16x16 RGBA 8 bit at quality 0.9, its' alpha is a separate lossless codestream
+RGBA_IMAGE_OFFSET = 158
+RGBA_ALPHA_OFFSET = 306
+
+
+def assert_quantizer(quantizer: codestream.CodestreamQuantizer, channel_mode: codestream.CodestreamQuantizerChannelMode, indices: tuple, steps: tuple):
+    assert (quantizer.channel_mode, quantizer.indices, quantizer.steps) == (channel_mode, indices, steps)
+
+
+def test_decode_lossless_image_plane_header():
+    headers = codestream.read_codestream_headers(RGB_PATH.read_bytes(), RGB_IMAGE_OFFSET)
+    plane_header = headers.image_plane_header
+    assert plane_header.size == 13
+    assert plane_header.internal_colour_format == codestream.CodestreamInternalColourFormat.YUV444
+    assert plane_header.channel_count == 3
+    assert not plane_header.scaled
+    assert not plane_header.lp_uses_dc_quantizer and not plane_header.hp_uses_lp_quantizer
+    for quantizer in (plane_header.dc_quantizer, plane_header.lp_quantizer, plane_header.hp_quantizer):
+        assert_quantizer(quantizer, codestream.CodestreamQuantizerChannelMode.INDEPENDENT, (0, 0, 0), (1, 1, 1))
+    assert headers.alpha_plane_header is None
+
+
+def test_decode_lossy_image_plane_header():
+    plane_header = codestream.read_codestream_headers(RGBA_LOSSY_PATH.read_bytes(), RGBA_IMAGE_OFFSET).image_plane_header
+    assert plane_header.size == 13
+    assert plane_header.scaled
+    independent = codestream.CodestreamQuantizerChannelMode.INDEPENDENT
+    # Chroma steps are shifted a bit less in the DC and LP bands
+    assert_quantizer(plane_header.dc_quantizer, independent, (10, 22, 28), (20, 22, 28))
+    assert_quantizer(plane_header.lp_quantizer, independent, (10, 22, 28), (20, 22, 28))
+    assert_quantizer(plane_header.hp_quantizer, independent, (11, 23, 28), (22, 46, 56))
+
+
+def test_decode_alpha_codestream_plane_header():
+    plane_header = codestream.read_codestream_headers(RGBA_LOSSY_PATH.read_bytes(), RGBA_ALPHA_OFFSET).image_plane_header
+    assert plane_header.size == 5
+    assert plane_header.internal_colour_format == codestream.CodestreamInternalColourFormat.YONLY
+    assert plane_header.channel_count == 1
+    assert_quantizer(plane_header.dc_quantizer, codestream.CodestreamQuantizerChannelMode.UNIFORM, (0,), (1,))
+
+
+def test_decode_interleaved_alpha_plane_header():
+    # Splice the alpha codestream's plane header after the image plane header and flag it as an alpha image plane
+    data = RGBA_LOSSY_PATH.read_bytes()
+    image_headers = codestream.read_codestream_headers(data, RGBA_IMAGE_OFFSET)
+    alpha_headers = codestream.read_codestream_headers(data, RGBA_ALPHA_OFFSET)
+    image_header_size = image_headers.size - image_headers.image_plane_header.size
+    alpha_plane = data[RGBA_ALPHA_OFFSET + alpha_headers.size - alpha_headers.image_plane_header.size:RGBA_ALPHA_OFFSET + alpha_headers.size]
+    spliced = bytearray(data[RGBA_IMAGE_OFFSET:RGBA_IMAGE_OFFSET + image_headers.size] + alpha_plane)
+    spliced[10] |= 1 # Alpha image plane flag, bit 8 of the big endian flags word after the signature
+
+    headers = codestream.read_codestream_headers(bytes(spliced))
+    assert headers.image_header.alpha_image_plane
+    assert headers.image_plane_header == image_headers.image_plane_header
+    assert headers.alpha_plane_header == alpha_headers.image_plane_header
+    assert headers.size == image_header_size + image_headers.image_plane_header.size + alpha_headers.image_plane_header.size
+
+
+@pytest.mark.parametrize("index, scaled, shift, step", [
+    (0, False, 1, 1),
+    (1, False, 1, 1),
+    (5, False, 1, 2),
+    (31, False, 1, 8),
+    (32, False, 1, 8),
+    (47, False, 1, 16),
+    (48, False, 1, 16),
+    (255, False, 1, 31 << 12),
+    (15, True, 1, 30),
+    (16, True, 1, 32),
+    (16, True, 0, 16),
+    (255, True, 1, 31 << 15)
+])
+def test_quantization_step(index, scaled, shift, step):
+    assert codestream.get_quantization_step(index, scaled, shift) == step
+    assert codestream.QUANTIZATION_STEP_LUT[scaled, shift][index] == step
+
+
+def test_make_quantizer_shifts_chroma_steps():
+    independent = codestream.CodestreamQuantizerChannelMode.INDEPENDENT
+    assert_quantizer(codestream.make_quantizer(independent, (10, 22, 28), True, True), independent, (10, 22, 28), (20, 22, 28))
+    assert_quantizer(codestream.make_quantizer(independent, (10, 22, 28), True, False), independent, (10, 22, 28), (20, 44, 56))
+    # Unscaled steps don't depend on the shift
+    assert_quantizer(codestream.make_quantizer(independent, (10, 22, 28), False, True), independent, (10, 22, 28), (3, 6, 7))
+
+
+"""
+Index table
+"""
+RGB_CODESTREAM_SIZE = 385
+
+
+def read_rgb_codestream() -> bytes:
+    return RGB_PATH.read_bytes()[RGB_IMAGE_OFFSET:RGB_IMAGE_OFFSET + RGB_CODESTREAM_SIZE]
+
+
+def splice_index_table(entries: bytes) -> tuple[bytes, int]:
+    """Return the RGB codestream laid out in frequency mode with an index table of entries, a variable length word per packet, and the offset of its' tiles"""
+    data = read_rgb_codestream()
+    headers_size = codestream.read_codestream_headers(data).size
+    table = b"\x00\x01" + entries
+    spliced = bytearray(data[:headers_size] + table + data[headers_size:])
+    spliced[9] |= 0x44 # Frequency mode layout and index table present, bits 22 and 18 of the flags word
+    # The subsequent bytes of the RGB codestream, a 2 byte size and 4 bytes of profile and level info
+    return bytes(spliced), headers_size + len(table) + 6
+
+
+def test_read_index_table_without_table():
+    data = read_rgb_codestream()
+    index_table = codestream.read_index_table(data)
+    assert index_table.tiles_offset == 35
+    assert (index_table.tile_rows, index_table.tile_columns, index_table.packets_per_tile) == (1, 1, 1)
+    assert (list(index_table.packet_offsets), list(index_table.packet_sizes)) == ([35], [350])
+    assert bytes(index_table.view_packet(data, 0, 0)) == data[35:]
+
+
+def test_read_index_table_variable_length_words():
+    # One packet per band: a 2 byte word, a 4 byte word escaped by 0xFB, an escape code for an absent packet and another 2 byte word
+    data, tiles_offset = splice_index_table(b"\x00\x00" + b"\xfb\x00\x00\x00\xa0" + b"\xff" + b"\x00\x10")
+    index_table = codestream.read_index_table(data)
+    assert index_table.tiles_offset == tiles_offset
+    assert index_table.packets_per_tile == 4
+    assert list(index_table.packet_offsets) == [tiles_offset, tiles_offset + 0xA0, -1, tiles_offset + 0x10]
+    # Each packet runs up to the next one in the codestream rather than the next one in the table
+    assert list(index_table.packet_sizes) == [0x10, len(data) - tiles_offset - 0xA0, -1, 0xA0 - 0x10]
+
+    assert bytes(index_table.view_packet(data, 0, 0, codestream.CodestreamBand.LP)) == data[tiles_offset + 0xA0:]
+    assert bytes(index_table.view_packet(data, 0, 0, codestream.CodestreamBand.FLEXBITS)) == data[tiles_offset + 0x10:tiles_offset + 0xA0]
+    assert index_table.view_packet(data, 0, 0, codestream.CodestreamBand.HP) is None
+    with pytest.raises(IndexError):
+        index_table.view_packet(data, 0, 1)
+
+
+def test_view_packet_without_table():
+    # Packets other than a lone one can't be located without an index table
+    data = bytearray(read_rgb_codestream())
+    data[9] |= 0x40 # Frequency mode layout, bit 22 of the flags word
+    index_table = codestream.read_index_table(bytes(data))
+    assert (index_table.tiles_offset, index_table.packets_per_tile) == (35, 4)
+    with pytest.raises(codestream.CodestreamMissingIndexTableError):
+        index_table.view_packet(bytes(data), 0, 0)
+
+
+def test_read_index_table_rejects_truncated_table():
+    data, _ = splice_index_table(b"\x00\x00" + b"\xfb\x00\x00\x00\xa0" + b"\xff" + b"\x00\x10")
+    headers_size = codestream.read_codestream_headers(data).size
+    with pytest.raises(codestream.CodestreamIndexTableError):
+        codestream.read_index_table(data[:headers_size + 6])
+
+
+def test_read_index_table_rejects_offsets_past_end():
+    data, _ = splice_index_table(b"\x00\x00" + b"\xfb\x00\x01\x00\x00" + b"\xff" + b"\x00\x10")
+    with pytest.raises(codestream.CodestreamIndexTableError):
+        codestream.read_index_table(data)
@@ -0,0 +1,25 @@
+from pathlib import Path
+import io
+
+import pytest
+
+from purejxr import jxrfile
+from purejxr._iotools import FileReader, write_payload
+
+RGB_PATH = Path(__file__).parent / "data" / "rgb_16x16.jxr"
+
+
+def test_file_reader_rejects_closed_file():
+    with open(RGB_PATH, "rb") as file:
+        reader = FileReader(file)
+        assert reader.read_at(0, 3) == jxrfile.JXR_SIGNATURE
+        bitstream = jxrfile.read(reader).image_file_directories[0].image_bitstream()
+
+    with pytest.raises(ValueError):
+        reader.read_at(0, 3)
+    with pytest.raises(ValueError):
+        reader.get_size()
+    with pytest.raises(ValueError):
+        bitstream.read_at(0, 8)
+    with pytest.raises(ValueError):
+        write_payload(io.BytesIO(), bitstream)
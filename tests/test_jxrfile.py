@@ -0,0 +1,400 @@
+from pathlib import Path
+from struct import pack, pack_into, unpack_from
+import io
+import os
+
+import pytest
+
+from purejxr import jxrfile
+from purejxr._iotools import FileReader, RangeReader
+from purejxr.jxrfile import JXRFieldTag, JXRElementType, JXRImageFileDirectoryEntry
+
+DATA_PATH = Path(__file__).parent / "data"
+RGB_PATH = DATA_PATH / "rgb_16x16.jxr" # 16x16 RGB 8 bit, a single ifd without alpha
+
+
+def load_rgb() -> tuple[jxrfile.JXRFile, bytes]:
+    data = RGB_PATH.read_bytes()
+    jxr_file = jxrfile.read(data)
+    return jxr_file, bytes(jxrfile.read_image_bitstream(data, jxr_file.image_file_directories[0]))
+
+
+def get_metadata_entries(ifd: jxrfile.JXRImageFileDirectory) -> dict:
+    return {tag: (entry.element_type, entry.element_count, bytes(entry.data[:entry.get_data_size()])) for tag, entry in ifd.entries.items() if tag not in jxrfile.BITSTREAM_ENTRY_TAGS}
+
+
+def write_bytes(jxr_file: jxrfile.JXRFile, image_payload, alpha_payload=None) -> tuple[jxrfile.JXRFile, bytes]:
+    stream = io.BytesIO()
+    written = jxrfile.write(stream, jxr_file, image_payload, alpha_payload)
+    return written, stream.getvalue()
+
+
+"""
+Writing
+"""
+def test_write_round_trips_metadata_and_bitstream():
+    jxr_file, image = load_rgb()
+    written, data = write_bytes(jxr_file, image)
+
+    reread = jxrfile.read(data)
+    ifd = reread.image_file_directories[0]
+    assert reread.header.version == jxrfile.WRITER_FILE_VERSION
+    assert get_metadata_entries(ifd) == get_metadata_entries(jxr_file.image_file_directories[0])
+    assert bytes(ifd.image_bitstream()) == image
+    assert ifd.alpha_bitstream() is None
+    assert reread.header == written.header
+    assert ifd.entries == written.image_file_directories[0].entries
+
+
+def test_write_lays_out_several_ifds_with_alpha():
+    jxr_file, image = load_rgb()
+    ifd = jxr_file.image_file_directories[0]
+    jxr_file.image_file_directories = [ifd, jxrfile.JXRImageFileDirectory(ifd.entry_count, dict(ifd.entries), 0)]
+    alpha = b"alpha plane"
+    _, data = write_bytes(jxr_file, [image, image[::-1]], [None, alpha])
+
+    first, second = jxrfile.read(data).image_file_directories
+    assert first.next_ifd_offset != 0 and second.next_ifd_offset == 0
+    assert bytes(first.image_bitstream()) == image and first.alpha_bitstream() is None
+    assert bytes(second.image_bitstream()) == image[::-1]
+    assert bytes(second.alpha_bitstream()) == alpha
+
+
+def test_write_lays_out_several_ifds_without_alpha():
+    jxr_file, image = load_rgb()
+    ifd = jxr_file.image_file_directories[0]
+    jxr_file.image_file_directories = [ifd, jxrfile.JXRImageFileDirectory(ifd.entry_count, dict(ifd.entries), 0)]
+    _, data = write_bytes(jxr_file, [image, image[::-1]])
+
+    first, second = jxrfile.read(data).image_file_directories
+    assert bytes(first.image_bitstream()) == image and bytes(second.image_bitstream()) == image[::-1]
+    assert first.alpha_bitstream() is None and second.alpha_bitstream() is None
+
+
+def test_write_copies_file_range_payloads(tmp_path):
+    jxr_file, image = load_rgb()
+    output_path = tmp_path / "copy.jxr"
+    with open(RGB_PATH, "rb") as source, open(output_path, "wb") as output:
+        ifd = jxrfile.read(source).image_file_directories[0]
+        payload = ifd.image_bitstream()
+        assert isinstance(payload, RangeReader)
+        jxrfile.write(output, jxr_file, payload)
+
+    with open(output_path, "rb") as file:
+        assert bytes(jxrfile.read_image_bitstream(file, jxrfile.read(file).image_file_directories[0])) == image
+
+
+def test_write_streams_file_range_payloads_to_pipe():
+    jxr_file, image = load_rgb()
+    _, expected = write_bytes(jxr_file, image)
+    read_fd, write_fd = os.pipe()
+    with open(RGB_PATH, "rb") as source, os.fdopen(write_fd, "wb") as output, os.fdopen(read_fd, "rb") as pipe:
+        # The file is far smaller than the pipe buffer, so it can be read back once written
+        jxrfile.write(output, jxr_file, jxrfile.read(source).image_file_directories[0].image_bitstream())
+        output.close()
+        assert pipe.read() == expected
+
+
+def test_write_round_trips_metadata_blocks():
+    jxr_file, image = load_rgb()
+    entries = jxr_file.image_file_directories[0].entries
+    entries[JXRFieldTag.XMP_METADATA] = JXRImageFileDirectoryEntry(JXRFieldTag.XMP_METADATA, JXRElementType.BYTE, 9, b"<x:xmp/>\0")
+    entries[JXRFieldTag.ICC_PROFILE] = JXRImageFileDirectoryEntry(JXRFieldTag.ICC_PROFILE, JXRElementType.UNDEFINED, 7, b"profile")
+    _, data = write_bytes(jxr_file, image)
+
+    reread = jxrfile.read(data).image_file_directories[0].entries
+    assert reread[JXRFieldTag.XMP_METADATA].decode() == b"<x:xmp/>\0"
+    assert reread[JXRFieldTag.ICC_PROFILE].decode() == b"profile"
+
+
+@pytest.mark.parametrize("entry", [
+    JXRImageFileDirectoryEntry(JXRFieldTag.RESERVED, JXRElementType.ULONG, 1, pack("<I", 1)),
+    JXRImageFileDirectoryEntry(JXRFieldTag.DOCUMENT_NAME, JXRElementType.RESERVED, 1, pack("<I", 1)),
+    jxrfile.make_ulong_entry(JXRFieldTag.EXIF_METADATA, 1000)
+])
+def test_write_rejects_entries_it_cant_carry_over(entry):
+    jxr_file, image = load_rgb()
+    jxr_file.image_file_directories[0].entries[entry.tag] = entry
+    with pytest.raises(jxrfile.JXRWriteError):
+        write_bytes(jxr_file, image)
+
+
+def test_read_keeps_several_metadata_blocks():
+    # These tags used to collapse into RESERVED, so a file holding two of them was rejected as having duplicate entries
+    data = bytearray(RGB_PATH.read_bytes())
+    ifd_offset = jxrfile.read(bytes(data)).header.ifd_offset
+    pack_into("<H", data, get_entry_record_offset(data, ifd_offset, JXRFieldTag.SPATIAL_XFRM_PRIMARY), JXRFieldTag.XMP_METADATA)
+    pack_into("<H", data, get_entry_record_offset(data, ifd_offset, JXRFieldTag.WIDTH_RESOLUTION), JXRFieldTag.ICC_PROFILE)
+
+    entries = jxrfile.read(bytes(data)).image_file_directories[0].entries
+    assert JXRFieldTag.XMP_METADATA in entries and JXRFieldTag.ICC_PROFILE in entries
+
+
+def test_write_rejects_mismatched_payload_count():
+    jxr_file, image = load_rgb()
+    with pytest.raises(jxrfile.JXRWriteError):
+        write_bytes(jxr_file, [image, image])
+
+
+def test_write_rejects_short_entry_data():
+    jxr_file, image = load_rgb()
+    jxr_file.image_file_directories[0].entries[JXRFieldTag.PIXEL_FORMAT].data = bytes(8)
+    with pytest.raises(jxrfile.JXREntryDataError):
+        write_bytes(jxr_file, image)
+
+
+"""
+Metadata updates
+"""
+def write_file(path: Path, ifd_count: int = 1, padding_size: int = 0) -> bytes:
+    """Write the RGB test image to path with a SOFTWARE_NAME_VERSION entry and optional PADDING_DATA slack in each ifd, returns the image bitstream"""
+    jxr_file, image = load_rgb()
+    entries = dict(jxr_file.image_file_directories[0].entries)
+    entries[JXRFieldTag.SOFTWARE_NAME_VERSION] = jxrfile.make_utf8_entry(JXRFieldTag.SOFTWARE_NAME_VERSION, "purejxr")
+    if padding_size:
+        entries[JXRFieldTag.PADDING_DATA] = JXRImageFileDirectoryEntry(JXRFieldTag.PADDING_DATA, JXRElementType.BYTE, padding_size, bytes(padding_size))
+    jxr_file.image_file_directories = [jxrfile.JXRImageFileDirectory(len(entries), dict(entries), 0) for _ in range(ifd_count)]
+
+    with open(path, "wb") as file:
+        jxrfile.write(file, jxr_file, [image] * ifd_count)
+    return image
+
+
+def read_file(path: Path) -> jxrfile.JXRFile:
+    with open(path, "rb") as file:
+        jxr_file = jxrfile.read(file)
+        for ifd in jxr_file.image_file_directories:
+            # Check the bitstreams were left where the entries say they are
+            assert bytes(jxrfile.read_image_bitstream(file, ifd)) == load_rgb()[1]
+    return jxr_file
+
+
+def get_text(ifd: jxrfile.JXRImageFileDirectory, tag: JXRFieldTag) -> str:
+    return ifd.entries[tag].decode()
+
+
+def test_update_overwrites_inline_entry_in_place(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    size = path.stat().st_size
+
+    assert jxrfile.update_metadata(path, {JXRFieldTag.IMAGE_WIDTH: jxrfile.make_ulong_entry(JXRFieldTag.IMAGE_WIDTH, 1234)})
+    assert path.stat().st_size == size
+    assert read_file(path).image_file_directories[0].entries[JXRFieldTag.IMAGE_WIDTH].decode() == 1234
+
+
+def test_update_overwrites_out_of_line_data_in_place(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    size = path.stat().st_size
+
+    assert jxrfile.update_metadata(path, {JXRFieldTag.SOFTWARE_NAME_VERSION: jxrfile.make_utf8_entry(JXRFieldTag.SOFTWARE_NAME_VERSION, "jxr")})
+    assert path.stat().st_size == size
+    assert get_text(read_file(path).image_file_directories[0], JXRFieldTag.SOFTWARE_NAME_VERSION) == "jxr"
+
+
+def test_update_carves_larger_data_from_padding(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path, padding_size=64)
+    size = path.stat().st_size
+    entry = jxrfile.make_utf8_entry(JXRFieldTag.SOFTWARE_NAME_VERSION, "a much longer software name")
+
+    assert jxrfile.update_metadata(path, {JXRFieldTag.SOFTWARE_NAME_VERSION: entry})
+    assert path.stat().st_size == size
+    ifd = read_file(path).image_file_directories[0]
+    assert get_text(ifd, JXRFieldTag.SOFTWARE_NAME_VERSION) == "a much longer software name"
+    assert ifd.entries[JXRFieldTag.PADDING_DATA].element_count == 64 - jxrfile.get_packed_data_size(entry)
+
+
+def test_update_appends_ifd_when_data_doesnt_fit(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    size = path.stat().st_size
+    text = "a much longer software name"
+
+    assert not jxrfile.update_metadata(path, {JXRFieldTag.SOFTWARE_NAME_VERSION: jxrfile.make_utf8_entry(JXRFieldTag.SOFTWARE_NAME_VERSION, text)})
+    assert path.stat().st_size > size
+    jxr_file = read_file(path)
+    assert jxr_file.header.ifd_offset >= size
+    assert get_text(jxr_file.image_file_directories[0], JXRFieldTag.SOFTWARE_NAME_VERSION) == text
+
+
+def test_update_appends_ifd_to_add_entry(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    original = read_file(path).image_file_directories[0]
+
+    assert not jxrfile.update_metadata(path, {JXRFieldTag.DOCUMENT_NAME: jxrfile.make_utf8_entry(JXRFieldTag.DOCUMENT_NAME, "page")})
+    ifd = read_file(path).image_file_directories[0]
+    assert get_text(ifd, JXRFieldTag.DOCUMENT_NAME) == "page"
+    assert list(ifd.entries) == sorted(ifd.entries)
+    assert {tag: entry for tag, entry in ifd.entries.items() if tag != JXRFieldTag.DOCUMENT_NAME} == original.entries
+
+
+def test_update_removes_entry(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+
+    assert not jxrfile.update_metadata(path, {JXRFieldTag.SOFTWARE_NAME_VERSION: None})
+    ifd = read_file(path).image_file_directories[0]
+    assert JXRFieldTag.SOFTWARE_NAME_VERSION not in ifd.entries
+    assert ifd.entries[JXRFieldTag.IMAGE_WIDTH].decode() == 16
+
+
+def test_update_removing_absent_entry_is_no_op(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    data = path.read_bytes()
+
+    assert jxrfile.update_metadata(path, {JXRFieldTag.DOCUMENT_NAME: None})
+    assert path.read_bytes() == data
+
+
+def test_update_patches_previous_ifd_offset(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path, ifd_count=3)
+    size = path.stat().st_size
+    header_offset = jxrfile.read(path.read_bytes()).header.ifd_offset
+
+    assert not jxrfile.update_metadata(path, {JXRFieldTag.DOCUMENT_NAME: jxrfile.make_utf8_entry(JXRFieldTag.DOCUMENT_NAME, "second")}, ifd_index=1)
+    jxr_file = read_file(path)
+    first, second, third = jxr_file.image_file_directories
+    assert jxr_file.header.ifd_offset == header_offset
+    assert first.next_ifd_offset >= size
+    assert get_text(second, JXRFieldTag.DOCUMENT_NAME) == "second"
+    assert JXRFieldTag.DOCUMENT_NAME not in first.entries and JXRFieldTag.DOCUMENT_NAME not in third.entries
+    assert second.next_ifd_offset != 0 and third.next_ifd_offset == 0
+
+
+@pytest.mark.parametrize("changes", [
+    {JXRFieldTag.DOCUMENT_NAME: jxrfile.make_utf8_entry(JXRFieldTag.PAGE_NAME, "page")},
+    {JXRFieldTag.RESERVED: None}
+])
+def test_update_rejects_invalid_changes(tmp_path, changes):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+    data = path.read_bytes()
+
+    with pytest.raises(jxrfile.JXRWriteError):
+        jxrfile.update_metadata(path, changes)
+    assert path.read_bytes() == data
+
+
+def test_update_rejects_missing_ifd(tmp_path):
+    path = tmp_path / "image.jxr"
+    write_file(path)
+
+    with pytest.raises(jxrfile.JXRWriteError):
+        jxrfile.update_metadata(path, {JXRFieldTag.IMAGE_WIDTH: jxrfile.make_ulong_entry(JXRFieldTag.IMAGE_WIDTH, 1)}, ifd_index=1)
+
+
+"""
+Reading
+"""
+def test_read_header_from_stream_position():
+    stream = io.BytesIO(b"prefix" + RGB_PATH.read_bytes())
+    stream.seek(6)
+    assert jxrfile.read_header(stream) == jxrfile.read(RGB_PATH.read_bytes()).header
+    with pytest.raises(jxrfile.JXRFileSignatureError):
+        jxrfile.read_header(stream, 0)
+
+
+"""
+Read limits
+"""
+def make_chain(ifd_count: int) -> bytes:
+    """Return the RGB test image written with ifd_count copies of its' ifd"""
+    jxr_file, image = load_rgb()
+    ifd = jxr_file.image_file_directories[0]
+    jxr_file.image_file_directories = [jxrfile.JXRImageFileDirectory(ifd.entry_count, dict(ifd.entries), 0) for _ in range(ifd_count)]
+    return write_bytes(jxr_file, [image] * ifd_count)[1]
+
+
+def get_entry_record_offset(data: bytes, ifd_offset: int, tag: JXRFieldTag) -> int:
+    entry_count = unpack_from("<H", data, ifd_offset)[0]
+    for index in range(entry_count):
+        offset = ifd_offset + 2 + index * jxrfile.JXR_IFD_ENTRY_LAYOUT.size
+        if unpack_from("<H", data, offset)[0] == tag:
+            return offset
+    raise KeyError(tag)
+
+
+def get_next_offset_position(data: bytes, ifd_offset: int) -> int:
+    return ifd_offset + 2 + unpack_from("<H", data, ifd_offset)[0] * jxrfile.JXR_IFD_ENTRY_LAYOUT.size
+
+
+def test_read_rejects_self_looping_ifd():
+    data = bytearray(RGB_PATH.read_bytes())
+    ifd_offset = jxrfile.read(bytes(data)).header.ifd_offset
+    pack_into("<I", data, get_next_offset_position(data, ifd_offset), ifd_offset)
+
+    with pytest.raises(jxrfile.JXRCyclicIFDChainError):
+        jxrfile.read(bytes(data))
+
+
+def test_read_rejects_ifd_chain_looping_back():
+    data = bytearray(make_chain(2))
+    jxr_file = jxrfile.read(bytes(data))
+    second_offset = jxr_file.image_file_directories[0].next_ifd_offset
+    pack_into("<I", data, get_next_offset_position(data, second_offset), jxr_file.header.ifd_offset)
+
+    with pytest.raises(jxrfile.JXRCyclicIFDChainError):
+        jxrfile.read(bytes(data))
+    # The ifds before the loop are still yielded
+    with pytest.raises(jxrfile.JXRCyclicIFDChainError):
+        for index, _ in enumerate(jxrfile.iter_image_file_directories(bytes(data))):
+            assert index < 2
+
+
+def test_read_limits_ifd_count():
+    data = make_chain(3)
+    assert len(jxrfile.read(data, limits=jxrfile.JXRReadLimits(max_ifd_count=3)).image_file_directories) == 3
+    with pytest.raises(jxrfile.JXRLimitExceededError):
+        jxrfile.read(data, limits=jxrfile.JXRReadLimits(max_ifd_count=2))
+
+
+def test_read_limits_entry_data_size():
+    data = bytearray(RGB_PATH.read_bytes())
+    record_offset = get_entry_record_offset(data, jxrfile.read(bytes(data)).header.ifd_offset, JXRFieldTag.PIXEL_FORMAT)
+    pack_into("<I", data, record_offset + 4, 0x10000000) # 256MB of BYTE data
+
+    with pytest.raises(jxrfile.JXRLimitExceededError):
+        jxrfile.read(bytes(data))
+    with pytest.raises(jxrfile.JXRLimitExceededError):
+        jxrfile.read(RGB_PATH.read_bytes(), limits=jxrfile.JXRReadLimits(max_entry_data_size=15))
+
+
+def test_read_limits_metadata_size():
+    data = RGB_PATH.read_bytes()
+    ifd = jxrfile.read(data).image_file_directories[0]
+    table_size = ifd.entry_count * jxrfile.JXR_IFD_ENTRY_LAYOUT.size
+    metadata_size = jxrfile.get_metadata_size(ifd)
+    assert metadata_size > table_size
+
+    jxrfile.read(data, limits=jxrfile.JXRReadLimits(max_metadata_size=metadata_size))
+    for max_metadata_size in (table_size - 1, metadata_size - 1):
+        with pytest.raises(jxrfile.JXRLimitExceededError):
+            jxrfile.read(data, limits=jxrfile.JXRReadLimits(max_metadata_size=max_metadata_size))
+    # The limit covers every ifd in the file together
+    with pytest.raises(jxrfile.JXRLimitExceededError):
+        jxrfile.read(make_chain(2), limits=jxrfile.JXRReadLimits(max_metadata_size=metadata_size))
+
+
+def test_read_rejects_offsets_beyond_end_of_file():
+    data = RGB_PATH.read_bytes()
+    ifd_offset = jxrfile.read(data).header.ifd_offset
+
+    header_patched = bytearray(data)
+    pack_into("<I", header_patched, jxrfile.JXR_HEADER_IFD_OFFSET_POSITION, len(data) + 100)
+    entry_patched = bytearray(data)
+    pack_into("<I", entry_patched, get_entry_record_offset(data, ifd_offset, JXRFieldTag.PIXEL_FORMAT) + 8, len(data) - 8)
+    for patched in (header_patched, entry_patched):
+        with pytest.raises(jxrfile.JXROffsetOutOfBoundsError):
+            jxrfile.read(bytes(patched))
+        with pytest.raises(jxrfile.JXROffsetOutOfBoundsError):
+            jxrfile.read(io.BytesIO(patched))
+
+    bitstream_patched = bytearray(data)
+    pack_into("<I", bitstream_patched, get_entry_record_offset(data, ifd_offset, JXRFieldTag.IMAGE_BYTE_COUNT) + 8, len(data))
+    with pytest.raises(jxrfile.JXROffsetOutOfBoundsError):
+        jxrfile.read(bytes(bitstream_patched)).image_file_directories[0].image_bitstream()